@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+"""
+.net Parser Benchmark Script
+
+Generate a random reduced net (.net) with its equations,
+and time its parsing.
+
+This file is part of Kong.
+
+Kong is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Kong is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Kong. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Nicolas AMAT, LAAS-CNRS"
+__contact__ = "namat@laas.fr"
+__license__ = "GPLv3"
+__version__ = "2.0.0"
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../kong/'))
+from pt import PetriNet
+
+
+def write_net(number_places, number_transitions, arcs, filename, seed=0):
+    """ Write a random net (.net) with `number_places` places and `number_transitions` transitions,
+        each transition having at most `arcs` input and output arcs.
+    """
+    generator = random.Random(seed)
+    places = ["p{}".format(i) for i in range(number_places)]
+
+    with open(filename, 'w') as fp:
+        fp.write("# generated equations\n")
+        for i in range(number_places // 10):
+            fp.write("# R |- r{} = {} + {}\n".format(i, generator.choice(places), generator.choice(places)))
+
+        fp.write("\n")
+        fp.write("net {random}\n")
+
+        for i in range(number_transitions):
+            pre = ' '.join("{{{}}}{}".format(place, generator.choice(["", "*2"])) for place in generator.sample(places, generator.randint(1, arcs)))
+            post = ' '.join(generator.sample(places, generator.randint(1, arcs)))
+            fp.write("tr {{t{}}} : {{label {}}} {} -> {}\n".format(i, i, pre, post))
+
+        for place in places:
+            fp.write("pl {} ({})\n".format(place, generator.randint(0, 1)))
+
+
+def main():
+    """ Main Function.
+    """
+    # Arguments parser
+    parser = argparse.ArgumentParser(description='.net parser benchmark script')
+
+    parser.add_argument('places',
+                        metavar='places',
+                        type=int,
+                        nargs='?',
+                        default=50000,
+                        help='number of places (default: 50000)')
+
+    parser.add_argument('--transitions',
+                        type=int,
+                        default=None,
+                        help='number of transitions (default: number of places)')
+
+    parser.add_argument('--arcs',
+                        type=int,
+                        default=4,
+                        help='maximal number of input and output arcs per transition (default: 4)')
+
+    results = parser.parse_args()
+
+    number_transitions = results.transitions if results.transitions is not None else results.places
+
+    with tempfile.TemporaryDirectory() as directory:
+        net_filename = os.path.join(directory, 'random.net')
+        write_net(results.places, number_transitions, results.arcs, net_filename)
+
+        start_time = time.time()
+        net = PetriNet(net_filename)
+        print("# Parsing time:", time.time() - start_time)
+        print("# Places:", net.number_places, "Transitions:", len(net.pre))
+
+
+if __name__ == '__main__':
+    main()
+    exit(0)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+"""
+Deep Token Flow Graph Benchmark Script
+
+Build a synthetic Token Flow Graph made of a single chain of
+alternating agglomerations and redundancies, and time its traversals.
+
+This file is part of Kong.
+
+Kong is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Kong is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Kong. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Nicolas AMAT, LAAS-CNRS"
+__contact__ = "namat@laas.fr"
+__license__ = "GPLv3"
+__version__ = "2.0.0"
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../kong/'))
+from pt import PetriNet
+from tfg import TFG
+
+
+def write_chain(depth, pnml_filename, net_filename):
+    """ Write the initial net (.pnml) and the reduced net with its equations (.net)
+        of a chain of depth `depth`.
+    """
+    places = ["p{}".format(i) for i in range(depth)]
+
+    with open(pnml_filename, 'w') as fp:
+        fp.write('<?xml version="1.0"?>\n')
+        fp.write('<pnml xmlns="http://www.pnml.org/version-2009/grammar/pnml">\n')
+        fp.write(' <net id="chain" type="http://www.pnml.org/version-2009/grammar/ptnet">\n')
+        fp.write('  <page id="page">\n')
+        for place in places:
+            fp.write('   <place id="{0}"><name><text>{0}</text></name></place>\n'.format(place))
+        fp.write('  </page>\n')
+        fp.write(' </net>\n')
+        fp.write('</pnml>\n')
+
+    with open(net_filename, 'w') as fp:
+        fp.write("# generated equations\n")
+
+        # Alternate agglomerations (`a_i = current + p_i`) and redundancies (`current = p_i`)
+        current = places[0]
+        for i in range(1, depth):
+            if i % 2:
+                fp.write("# A |- a{} = {} + {}\n".format(i, current, places[i]))
+                current = "a{}".format(i)
+            else:
+                fp.write("# R |- {} = {}\n".format(current, places[i]))
+                current = places[i]
+
+        fp.write("\n")
+        fp.write("net {chain}\n")
+        fp.write("tr t {} -> {}\n".format(current, current))
+        fp.write("pl {} (1)\n".format(current))
+
+
+def main():
+    """ Main Function.
+    """
+    # Arguments parser
+    parser = argparse.ArgumentParser(description='Deep Token Flow Graph benchmark script')
+
+    parser.add_argument('depth',
+                        metavar='depth',
+                        type=int,
+                        nargs='?',
+                        default=100000,
+                        help='depth of the chain (default: 100000)')
+
+    parser.add_argument('--conc',
+                        action='store_true',
+                        help='also compute the concurrency matrix (quadratic in the depth)')
+
+    results = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        pnml_filename, net_filename = os.path.join(directory, 'chain.pnml'), os.path.join(directory, 'chain.net')
+        write_chain(results.depth, pnml_filename, net_filename)
+
+        start_time = time.time()
+        initial_net = PetriNet(pnml_filename, initial_net=True, no_units=True)
+        reduced_net = PetriNet(net_filename)
+        tfg = TFG(net_filename, initial_net, reduced_net)
+        print("# TFG time:", time.time() - start_time)
+
+        snapshot_filename = os.path.join(directory, 'chain.tfg')
+        tfg.save(snapshot_filename)
+        start_time = time.time()
+        TFG.load(snapshot_filename)
+        print("# TFG snapshot loading time:", time.time() - start_time)
+
+        start_time = time.time()
+        tfg.dead_places_vector('0', True)
+        print("# Dead places time:", time.time() - start_time)
+
+        start_time = time.time()
+        tfg.explore_leaves(tfg.indices[reduced_net.places[0]], set())
+        print("# Leaves exploration time:", time.time() - start_time)
+
+        start_time = time.time()
+        tfg.marking_projection({})
+        print("# Marking projection time:", time.time() - start_time)
+
+        start_time = time.time()
+        tfg.marking_projection({})
+        print("# Marking projection time (second marking):", time.time() - start_time)
+
+        start_time = time.time()
+        tfg.marking_projections([[0] * initial_net.number_places] * 100)
+        print("# Bulk marking projection time (100 markings):", time.time() - start_time)
+
+        reduced_matrix = [['1']]
+
+        start_time = time.time()
+        tfg.concurrent_places(reduced_matrix, True, initial_net.places[0], initial_net.places[-1])
+        print("# Pair query time:", time.time() - start_time)
+
+        start_time = time.time()
+        tfg.concurrency_row(reduced_matrix, True, initial_net.places[0])
+        print("# Row query time:", time.time() - start_time)
+
+        start_time = time.time()
+        tfg.concurrency_blocks(reduced_matrix)
+        print("# Factored concurrency relation time:", time.time() - start_time)
+
+        if results.conc:
+            start_time = time.time()
+            tfg.concurrency_matrix(reduced_matrix, True)
+            print("# Concurrency matrix time:", time.time() - start_time)
+
+
+if __name__ == '__main__':
+    main()
+    exit(0)
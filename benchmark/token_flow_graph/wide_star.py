@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+"""
+Wide Token Flow Graph Benchmark Script
+
+Build a synthetic Token Flow Graph made of a single place with many redundant copies,
+time the factored and the expanded concurrency relations, and check that
+the factored output is linear in the width and expands to the concurrency matrix.
+
+This file is part of Kong.
+
+Kong is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Kong is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Kong. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Nicolas AMAT, LAAS-CNRS"
+__contact__ = "namat@laas.fr"
+__license__ = "GPLv3"
+__version__ = "2.0.0"
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../kong/'))
+from pt import PetriNet
+from tfg import TFG
+from utils import matrix_from_factored, show_factored
+
+# Maximal size of the factored output per place (in bytes)
+MAX_BYTES_PER_PLACE = 32
+
+
+def write_star(width, pnml_filename, net_filename):
+    """ Write the initial net (.pnml) and the reduced net with its equations (.net)
+        of a star of width `width` (redundancies `p0 = p_i`).
+    """
+    places = ["p{}".format(i) for i in range(width + 1)]
+
+    with open(pnml_filename, 'w') as fp:
+        fp.write('<?xml version="1.0"?>\n')
+        fp.write('<pnml xmlns="http://www.pnml.org/version-2009/grammar/pnml">\n')
+        fp.write(' <net id="star" type="http://www.pnml.org/version-2009/grammar/ptnet">\n')
+        fp.write('  <page id="page">\n')
+        for place in places:
+            fp.write('   <place id="{0}"><name><text>{0}</text></name></place>\n'.format(place))
+        fp.write('  </page>\n')
+        fp.write(' </net>\n')
+        fp.write('</pnml>\n')
+
+    with open(net_filename, 'w') as fp:
+        fp.write("# generated equations\n")
+        for place in places[1:]:
+            fp.write("# R |- {} = {}\n".format(places[0], place))
+
+        fp.write("\n")
+        fp.write("net {star}\n")
+        fp.write("tr t {} -> {}\n".format(places[0], places[0]))
+        fp.write("pl {} (1)\n".format(places[0]))
+
+
+def main():
+    """ Main Function.
+    """
+    # Arguments parser
+    parser = argparse.ArgumentParser(description='Wide Token Flow Graph benchmark script')
+
+    parser.add_argument('width',
+                        metavar='width',
+                        type=int,
+                        nargs='?',
+                        default=3000,
+                        help='number of redundant copies of the place (default: 3000)')
+
+    results = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        pnml_filename, net_filename = os.path.join(directory, 'star.pnml'), os.path.join(directory, 'star.net')
+        write_star(results.width, pnml_filename, net_filename)
+
+        initial_net = PetriNet(pnml_filename, initial_net=True, no_units=True)
+        reduced_net = PetriNet(net_filename)
+        tfg = TFG(net_filename, initial_net, reduced_net)
+        reduced_matrix = [['1']]
+
+        start_time = time.time()
+        output = io.StringIO()
+        show_factored(tfg, *tfg.concurrency_blocks(reduced_matrix), output=output)
+        print("# Factored concurrency relation time:", time.time() - start_time)
+        print("# Factored concurrency relation size:", len(output.getvalue()))
+
+        start_time = time.time()
+        factored_matrix = matrix_from_factored(io.StringIO(output.getvalue()))
+        print("# Expansion time:", time.time() - start_time)
+
+        start_time = time.time()
+        matrix = tfg.concurrency_matrix(reduced_matrix, True)
+        print("# Concurrency matrix time:", time.time() - start_time)
+
+        assert len(output.getvalue()) <= MAX_BYTES_PER_PLACE * initial_net.number_places, "Factored output not linear in the width"
+        assert all(factored_matrix.row(i) == matrix.row(i) for i in range(len(matrix))), "Expansion differs from the concurrency matrix"
+
+
+if __name__ == '__main__':
+    main()
+    exit(0)
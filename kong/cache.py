@@ -0,0 +1,125 @@
+"""
+Cache Module
+
+Content-addressed on-disk cache, with a least recently used eviction
+policy bounded by the total size of the entries.
+
+This file is part of Kong.
+
+Kong is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Kong is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Kong. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Nicolas AMAT, LAAS-CNRS"
+__contact__ = "namat@laas.fr"
+__license__ = "GPLv3"
+__version__ = "2.0.0"
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+# Size of the chunks read when hashing a file
+CHUNK_SIZE = 1 << 20
+
+
+class Cache:
+    """
+    On-disk cache.
+
+    Each entry is a file named after its key,
+    the modification time of an entry being its last use.
+    """
+
+    def __init__(self, directory, max_size):
+        """ Initializer.
+        """
+        # Directory of the entries
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        # Maximal total size of the entries (in bytes)
+        self.max_size = max_size
+
+    def key(self, filenames, options):
+        """ Return the key associated to the content of some files
+            and a list of options.
+        """
+        digest = hashlib.sha256()
+
+        for filename in filenames:
+            with open(filename, 'rb') as fp:
+                for chunk in iter(lambda: fp.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+            digest.update(b'\0')
+
+        digest.update('\0'.join(options).encode('utf-8'))
+
+        return digest.hexdigest()
+
+    def path(self, key, suffix):
+        """ Return the path of an entry.
+        """
+        return os.path.join(self.directory, key + suffix)
+
+    def get(self, key, suffix):
+        """ Return the path of an entry and mark it as used,
+            or None if the entry does not exist.
+        """
+        path = self.path(key, suffix)
+
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+
+        return path
+
+    def put(self, key, suffix, filename):
+        """ Copy a file as an entry,
+            and evict the least recently used entries if needed.
+        """
+        # Write to a temporary file first, so that concurrent runs never read a partial entry
+        fd, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(fd)
+        shutil.copyfile(filename, temporary)
+        os.replace(temporary, self.path(key, suffix))
+
+        self.eviction()
+
+    def eviction(self):
+        """ Evict the least recently used entries
+            until the total size is within the bound.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.tmp'):
+                continue
+            # Entries can be evicted concurrently by other runs
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_size = sum(size for _, size, _ in entries)
+
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
@@ -28,17 +28,263 @@ __license__ = "GPLv3"
 __version__ = "2.0.0"
 
 import argparse
+import asyncio
+import json
 import logging as log
 import os
+import signal
 import subprocess
 import sys
 import tempfile
+import threading
 import time
-from shutil import which
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from shutil import copyfile, which
 
+from cache import Cache
 from pt import PetriNet
 from tfg import TFG
-from utils import marking_parser, matrix_from_str, show_matrix
+from utils import dead_places_from_matrix, decided_cells, marking_parser, markings_parser, matrix_from_lines, rle_encoding, show_factored, show_matrix, stitch_matrix, stitch_vector
+
+
+# Silence the debug messages of the event loop in verbose mode
+log.getLogger('asyncio').setLevel(log.WARNING)
+
+
+def show_normalization_time(initial_net):
+    """ Show the time spent writing a copy of the input net with place names equal to ids,
+        or that the copy has been skipped.
+    """
+    if initial_net.normalization_time is None:
+        print("# Place names normalization: skipped (names already equal to ids)", file=sys.stderr)
+    else:
+        print("# Place names normalization time:", initial_net.normalization_time, file=sys.stderr)
+
+
+def get_cache(args):
+    """ Return the cache if enabled, None otherwise.
+    """
+    if args.cache_dir:
+        return Cache(args.cache_dir, args.cache_size * 2 ** 20)
+    else:
+        return None
+
+
+def caesar_bdd_limits(env=None):
+    """ Return the time and iteration limits of caesar.bdd.
+        (None if unlimited, read from `env` if given, from the environment otherwise)
+    """
+    if env is None:
+        env = os.environ
+
+    return {variable: int(env[variable]) if env.get(variable) else None for variable in ('CAESAR_BDD_TIMEOUT', 'CAESAR_BDD_ITERATIONS')}
+
+
+def reduction_commands(args, infile):
+    """ Return the reduction commands (without the output file) by engine name.
+        (all the available engines in portfolio mode)
+    """
+    reduce_command = ["reduce", "-rg,redundant,compact,4ti2", "-redundant-limit", "650", "-redundant-time", "10", "-inv-limit", "1000", "-inv-time", "10", "-PNML", infile]
+    shrink_command = ["shrink", "--equations", "--clean", "--redundant", "--compact", "-i", infile, "-o"]
+
+    if not getattr(args, 'portfolio', False):
+        if not args.shrink and which("reduce") is not None:
+            return [("reduce", reduce_command)]
+        else:
+            return [("shrink", shrink_command)]
+
+    commands = []
+    if which("reduce") is not None:
+        commands.append(("reduce", reduce_command))
+        for options in args.portfolio_reduce_options or []:
+            commands.append(("reduce {}".format(options), ["reduce"] + options.split() + ["-PNML", infile]))
+    if which("shrink") is not None:
+        commands.append(("shrink", shrink_command))
+
+    return commands
+
+
+def run_until_complete(coroutine):
+    """ Run a coroutine in a new event loop, then close the loop.
+        (`asyncio.run` requires Python >= 3.7)
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+async def run_reduction(command):
+    """ Run a reduction tool.
+        (the tool is killed if cancelled)
+    """
+    # The creation of the process is shielded, so that a cancelled reduction tool is always killed
+    creation = asyncio.ensure_future(asyncio.create_subprocess_exec(*command))
+    try:
+        process = await asyncio.shield(creation)
+        returncode = await process.wait()
+    except asyncio.CancelledError:
+        process = await creation
+        # Signal sent directly, `Process.kill` would reap the process behind the back of the event loop
+        try:
+            os.kill(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await process.wait()
+        raise
+
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command)
+
+
+async def portfolio_reduction(commands, reduced_net_filename, budget=None):
+    """ Run the reduction tools concurrently, and return the name of the winner.
+        (the first to finish, or the best reduction ratio among the tools finished within the time budget)
+    """
+    loop = asyncio.get_event_loop()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # One output file per tool
+        tasks = {}
+        for index, (engine, command) in enumerate(commands):
+            output = os.path.join(directory, "{}.net".format(index))
+            tasks[asyncio.ensure_future(run_reduction(command + [output]))] = (engine, output)
+
+        deadline = loop.time() + budget if budget is not None else None
+        winner, number_places, error = None, None, None
+
+        pending = set(tasks)
+        try:
+            while pending:
+                # Wait for the first tool to finish, then until the end of the budget
+                timeout = max(0, deadline - loop.time()) if deadline is not None and winner is not None else None
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    break
+
+                for task in done:
+                    engine, output = tasks[task]
+                    if task.exception() is not None:
+                        log.warning("> Reduction with %s failed", engine)
+                        error = task.exception()
+                        continue
+                    candidate_places = PetriNet(output).number_places
+                    if winner is None or candidate_places < number_places:
+                        winner, number_places = (engine, output), candidate_places
+
+                if winner is not None and deadline is None:
+                    break
+        finally:
+            # Kill the remaining tools
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        if winner is None:
+            raise RuntimeError("No reduction tool succeeded") from error
+
+        copyfile(winner[1], reduced_net_filename)
+
+    return winner[0]
+
+
+def reduction_key(args, infile, commands, cache):
+    """ Return the cache key of the reduced net.
+        (content of the net given to the reduction tools and command lines without the file names)
+    """
+    options = [option for _, command in commands for option in command if option != infile]
+    if len(commands) > 1:
+        options.append("portfolio {}".format(args.portfolio_time))
+
+    return cache.key([infile], options)
+
+
+async def reduction(args, infile, reduced_net_filename, cacheable=True):
+    """ Reduce the input net,
+        or get the reduced net from the cache if enabled.
+        Output: name of the engine ('cache' if the reduced net comes from the cache).
+        (the reduction tools are killed if cancelled, the reduced net is put in the cache only if `cacheable`)
+    """
+    commands = reduction_commands(args, infile)
+
+    cache = get_cache(args)
+    if cache is not None:
+        key = reduction_key(args, infile, commands, cache)
+
+        cached_net = cache.get(key, '.net')
+        if cached_net is not None:
+            try:
+                copyfile(cached_net, reduced_net_filename)
+                log.info("> Get the reduced net from the cache")
+                return 'cache'
+            except FileNotFoundError:
+                # Evicted by another run
+                pass
+
+    if len(commands) == 1:
+        engine, command = commands[0]
+        await run_reduction(command + [reduced_net_filename])
+    else:
+        log.info("> Race %s", ", ".join(engine for engine, _ in commands))
+        engine = await portfolio_reduction(commands, reduced_net_filename, args.portfolio_time)
+
+    if cache is not None and cacheable:
+        cache.put(key, '.net', reduced_net_filename)
+
+    return engine
+
+
+async def read_and_reduce(args, infile, reduced_net_filename, no_units=False):
+    """ Read the input net while reducing it.
+        (the reduction starts on the input file,
+         and is restarted on the normalized copy if the place names need to be normalized)
+        Output: initial net, reduction time and name of the reduction engine.
+    """
+    loop = asyncio.get_event_loop()
+
+    # Start the reduction (if a reduced net is to be computed)
+    # The reduced net is put in the cache only once kept, it is dropped if the place names need to be normalized
+    reduction_task, start_time = None, time.time()
+    if reduced_net_filename is not None:
+        reduction_task = loop.create_task(reduction(args, infile, reduced_net_filename, cacheable=False))
+
+    # Read the initial net in a thread while the reduction tool runs
+    try:
+        initial_net = await loop.run_in_executor(None, lambda: PetriNet(infile, initial_net=True, no_units=no_units))
+    except BaseException:
+        if reduction_task is not None:
+            reduction_task.cancel()
+        raise
+
+    if reduction_task is not None:
+        if initial_net.f_file is not None:
+            # The reduction must be applied on the copy with place names equal to ids
+            log.info("> Restart the reduction on the normalized net")
+            reduction_task.cancel()
+            try:
+                await reduction_task
+            except (asyncio.CancelledError, Exception):
+                # The reduction of the input file is dropped, even if failed
+                pass
+            start_time = time.time()
+            reduction_task = loop.create_task(reduction(args, initial_net.f_file.name, reduced_net_filename))
+            engine = await reduction_task
+
+        else:
+            engine = await reduction_task
+
+            # The reduced net of the input file is kept
+            cache = get_cache(args)
+            if cache is not None and engine != 'cache':
+                cache.put(reduction_key(args, infile, reduction_commands(args, infile), cache), '.net', reduced_net_filename)
+    else:
+        engine = None
+
+    return initial_net, time.time() - start_time, engine
 
 
 def conc(args):
@@ -47,6 +293,12 @@ def conc(args):
     conc_dead(args, "concurrency matrix", "-concurrent-places")
 
 
+def both(args):
+    """ Concurrent and dead places computation wrapper.
+    """
+    conc_dead(args, "concurrency matrix", "-concurrent-places")
+
+
 def dead(args):
     """ Dead places computation wrapper.
     """
@@ -62,6 +314,9 @@ def conc_dead(args, computation, caesar_option):
     else:
         log.basicConfig(format="%(message)s")
 
+    # Global deadline of the anytime mode
+    deadline = time.time() + args.anytime if args.anytime else None
+
     # Set input file
     infile = args.infile
 
@@ -75,37 +330,33 @@ def conc_dead(args, computation, caesar_option):
     else:
         assert infile.lower().endswith('.pnml')
 
-    # Read initial Petri net
-    log.info("> Read the input net")
-    initial_net = PetriNet(infile, initial_net=True, no_units=args.no_units)
-    infile = initial_net.f_file.name if initial_net.f_file is not None else infile
-
-    # Show initial NUPN if option enabled
-    if args.show_nupns:
-        print("# Initial NUPN", file=sys.stderr)
-        print(initial_net.nupn, file=sys.stderr)
-
     # Manage reduced net
     f_reduced_net = None
     if args.reduced_net:
         reduced_net_filename = args.reduced_net
     else:
-        log.info("> Reduce the input net")
         if args.save_reduced_net:
             reduced_net_filename = os.path.splitext(args.infile)[0] + '_reduced.net'
         else:
             f_reduced_net = tempfile.NamedTemporaryFile(suffix='.net')
             reduced_net_filename = f_reduced_net.name
 
-        start_time = time.time()
+    # Read initial Petri net while reducing it
+    log.info("> Read and reduce the input net")
+    initial_net, reduction_time, engine = run_until_complete(read_and_reduce(args, infile, None if args.reduced_net else reduced_net_filename, args.no_units))
 
-        if not args.shrink and which("reduce") is not None:
-            subprocess.run(["reduce", "-rg,redundant,compact,4ti2", "-redundant-limit", "650", "-redundant-time", "10", "-inv-limit", "1000", "-inv-time", "10", "-PNML", infile, reduced_net_filename], check=True)
-        else:
-            subprocess.run(["shrink", "--equations", "--clean", "--redundant", "--compact", "-i", infile, "-o", reduced_net_filename], check=True)
+    # Show the time spent normalizing the place names if option enabled
+    if args.time:
+        show_normalization_time(initial_net)
+        if not args.reduced_net:
+            print("# Reduction time:", reduction_time, file=sys.stderr)
+            if args.portfolio:
+                print("# Reduction engine:", engine, file=sys.stderr)
 
-        if args.time:
-            print("# Reduction time:", time.time() - start_time, file=sys.stderr)
+    # Show initial NUPN if option enabled
+    if args.show_nupns:
+        print("# Initial NUPN", file=sys.stderr)
+        print(initial_net.nupn, file=sys.stderr)
 
     # Read reduced net
     log.info("> Read the reduced net")
@@ -160,18 +411,36 @@ def conc_dead(args, computation, caesar_option):
         elif os.getenv('CAESAR_BDD_ITERATIONS'):
             log.warning("> Environment variable CAESAR_BDD_ITERATIONS is already set to `%s'", os.environ['CAESAR_BDD_ITERATIONS'])
 
+        # Result of the original net if computed directly (race mode), and flag for results already shown (anytime mode)
+        direct_matrix, shown = None, False
+
+        if args.anytime and not reducible:
+            log.warning("> Irreducible net, the anytime mode is disabled")
+
         if not args.reduced_result:
-            if reducible:
-                # Compute concurrency matrix / dead places vector of the reduced net
-                log.info("> Compute the {} of the reduced net".format(computation))
-                caesar_bdd_data = subprocess.run([args.command_reduced, caesar_option, reduced_nupn], stdout=subprocess.PIPE)
+            if reducible and args.race_original and args.infile.lower().endswith('.nupn'):
+                # Race caesar.bdd on the reduced net and on the original net (*.nupn)
+                log.info("> Compute the {} of the reduced and the original nets concurrently".format(computation))
+                winner, (reduced_matrix, complete_matrix) = caesar_bdd_race(args, caesar_option, computation, reduced_net, reduced_nupn)
+                if winner == 'original':
+                    direct_matrix = reduced_matrix
+                caesar_bdd_time = time.time() - start_time
+                if args.time:
+                    print("# Caesar.bdd race winner:", winner, file=sys.stderr)
+            elif reducible and args.anytime:
+                # Refine the partial result with increasing time limits (each result is shown)
+                log.info("> Compute the {} of the reduced net with increasing time limits".format(computation))
+                anytime(args, caesar_option, computation, initial_net, reduced_net, reduced_nupn, tfg, deadline)
+                shown = True
+                caesar_bdd_time = time.time() - start_time
+            elif reducible:
+                reduced_matrix, complete_matrix = reduced_caesar_bdd(args, caesar_option, computation, reduced_net, reduced_nupn)
+                caesar_bdd_time = time.time() - start_time
+            elif args.sub_parsers == 'both':
+                # Compute the concurrency matrix of the original net (*.nupn), shown with the dead places vector
+                log.info("> Compute the {} of the original net".format(computation))
+                direct_matrix, _ = caesar_bdd(args.command_reduced, caesar_option, args.infile, get_cache(args))
                 caesar_bdd_time = time.time() - start_time
-                if caesar_bdd_data.returncode not in (0, 5):
-                    raise subprocess.CalledProcessError("Unexpected {} error while computing"\
-                          "the concurrency matrix of the reduced net".format(caesar_bdd_data.returncode))
-                reduced_matrix, complete_matrix = matrix_from_str(caesar_bdd_data.stdout.decode('utf-8'))
-                if args.sub_parsers == 'dead':
-                    reduced_matrix = reduced_matrix[0]
             else:
                 # Compute concurrency matrix / dead places vector of the original net (*.nupn)
                 log.info("> Compute the {} of the original net".format(computation))
@@ -183,19 +452,41 @@ def conc_dead(args, computation, caesar_option):
         else:
             log.info("> Read the {} of the reduced net".format(computation))
             caesar_bdd_time = 0
-            with open(args.reduced_matrix) as fp:
-                matrix_data = fp.read()
-            reduced_matrix, complete_matrix = matrix_from_str(matrix_data)
+            with open(args.reduced_result) as fp:
+                reduced_matrix, complete_matrix = matrix_from_lines(fp)
+            if args.sub_parsers == 'dead':
+                reduced_matrix = reduced_matrix[0]
 
     else:
         # Fully reducible net case
         reducible = True
+        direct_matrix, shown = None, False
+        if args.anytime:
+            log.info("> Fully reducible net, the anytime mode is disabled (the result is complete)")
         start_time = time.time()
         reduced_matrix = ''
         complete_matrix = True
         caesar_bdd_time = 0
 
-    if reducible:
+    if direct_matrix is not None:
+        # The result of the original net is shown as-is
+        show_result(args, direct_matrix, initial_net)
+
+    elif reducible and (getattr(args, 'pairs', None) or getattr(args, 'rows', None)):
+        # Answer the concurrency queries without the whole matrix
+        log.info("> Answer the concurrency queries")
+        concurrency_queries(args, tfg, reduced_matrix, complete_matrix)
+
+    elif reducible and not shown and getattr(args, 'factored', False) and complete_matrix:
+        # Show the concurrency relation as products of successors, without expanding the matrix
+        log.info("> Factored change of dimension")
+        alive, blocks, prefix_products = tfg.concurrency_blocks(reduced_matrix)
+        show_factored(tfg, alive, blocks, prefix_products, args.output)
+
+    elif reducible and not shown:
+        if getattr(args, 'factored', False):
+            log.warning("> Partial reduced matrix, the concurrency matrix is shown instead of the factored relation")
+
         # Show the reduced matrix / vector if enabled
         if args.show_reduced_result:
             print("# Reduced {}".format(computation), file=sys.stderr)
@@ -209,10 +500,10 @@ def conc_dead(args, computation, caesar_option):
         log.info("> Change of dimension")
         if args.sub_parsers == 'dead':
             vector = tfg.dead_places_vector(reduced_matrix, complete_matrix)
-            show_matrix(vector, initial_net, args.no_rle, args.place_names)
+            show_matrix(vector, initial_net, args.no_rle, args.place_names, args.output)
         else:
             matrix = tfg.concurrency_matrix(reduced_matrix, complete_matrix)
-            show_matrix(matrix, initial_net, args.no_rle, args.place_names)
+            show_result(args, matrix, initial_net)
 
     # Show computation time
     if args.time:
@@ -236,98 +527,385 @@ def conc_dead(args, computation, caesar_option):
         f_reduced_net.close()
 
 
+def caesar_bdd(command, caesar_option, nupn, cache=None, processes=None, env=None):
+    """ Run caesar.bdd on a NUPN and decode its result,
+        or get the result from the cache if enabled.
+        (the process is registered in `processes` if given, and run with the environment `env` if given)
+    """
+    if cache is not None:
+        # Key: content of the NUPN, command and option
+        key, limits = cache.key([nupn], [command, caesar_option]), caesar_bdd_limits(env)
+
+        cached_result = cache.get(key, '.bdd')
+        if cached_result is not None:
+            try:
+                with open(cached_result) as fp:
+                    header = json.loads(fp.readline())
+                    # A complete result satisfies any request, a partial one only requests with lower or equal limits
+                    if header['complete'] or all(header['limits'][variable] is None or (limit is not None and limit <= header['limits'][variable]) for variable, limit in limits.items()):
+                        log.info("> Get the caesar.bdd result from the cache")
+                        matrix, _ = matrix_from_lines(fp)
+                        return matrix, header['complete']
+            except FileNotFoundError:
+                # Evicted by another run
+                pass
+
+    # Decode the matrix while caesar.bdd writes it
+    with subprocess.Popen([command, caesar_option, nupn], stdout=subprocess.PIPE, universal_newlines=True, env=env) as caesar_bdd_data:
+        if processes is not None:
+            processes.register(caesar_bdd_data)
+        matrix, complete_matrix = matrix_from_lines(caesar_bdd_data.stdout)
+        # Drain the remaining output before waiting for caesar.bdd
+        caesar_bdd_data.stdout.read()
+
+    if caesar_bdd_data.returncode not in (0, 5):
+        raise subprocess.CalledProcessError(caesar_bdd_data.returncode, caesar_bdd_data.args)
+
+    if cache is not None:
+        # Store the result with its completeness and limits as header
+        with tempfile.NamedTemporaryFile('w', suffix='.bdd') as fp:
+            fp.write(json.dumps({'complete': complete_matrix, 'limits': limits}) + '\n')
+            fp.writelines(rle_encoding(''.join(line)) + '\n' for line in matrix)
+            fp.flush()
+            cache.put(key, '.bdd', fp.name)
+
+    return matrix, complete_matrix
+
+
+def caesar_bdd_components(command, caesar_option, net, components, vector=False, cache=None, processes=None, env=None):
+    """ Run caesar.bdd concurrently on the connected components of a net,
+        and stitch their results.
+        (components made of a single place are grouped in one run)
+    """
+    singletons = [component[0] for component in components if len(component) == 1]
+    jobs = [component for component in components if len(component) > 1]
+    if singletons:
+        jobs.append(singletons)
+
+    # Export the NUPN of each subnet
+    subnets, f_nupns = [net.subnet(places) for places in jobs], []
+    for subnet in subnets:
+        f_nupn = tempfile.NamedTemporaryFile(suffix='.nupn')
+        subnet.export_nupn(f_nupn.name)
+        f_nupns.append(f_nupn)
+
+    # Run one caesar.bdd per available CPU
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+        results = list(executor.map(lambda f_nupn: caesar_bdd(command, caesar_option, f_nupn.name, cache, processes, env), f_nupns))
+
+    for f_nupn in f_nupns:
+        f_nupn.close()
+
+    complete_matrix = all(complete for _, complete in results)
+
+    if vector:
+        return stitch_vector(net.places, [(subnet.places, matrix[0]) for subnet, (matrix, _) in zip(subnets, results)]), complete_matrix
+    else:
+        return stitch_matrix(net.places, [(subnet.places, matrix) for subnet, (matrix, _) in zip(subnets, results)]), complete_matrix
+
+
+def reduced_caesar_bdd(args, caesar_option, computation, reduced_net, reduced_nupn, processes=None, env=None):
+    """ Compute the concurrency matrix / dead places vector of the reduced net.
+        (one caesar.bdd per connected component unless disabled)
+    """
+    # Split the reduced net into its connected components
+    components = [reduced_net.places] if args.no_split else reduced_net.connected_components()
+
+    if len(components) > 1:
+        # Compute concurrency matrix / dead places vector of each component of the reduced net
+        log.info("> Compute the {} of the {} connected components of the reduced net".format(computation, len(components)))
+        return caesar_bdd_components(args.command_reduced, caesar_option, reduced_net, components, args.sub_parsers == 'dead', get_cache(args), processes, env)
+    else:
+        # Compute concurrency matrix / dead places vector of the reduced net
+        log.info("> Compute the {} of the reduced net".format(computation))
+        reduced_matrix, complete_matrix = caesar_bdd(args.command_reduced, caesar_option, reduced_nupn, get_cache(args), processes, env)
+        if args.sub_parsers == 'dead':
+            reduced_matrix = reduced_matrix[0]
+        return reduced_matrix, complete_matrix
+
+
+def concurrency_queries(args, tfg, reduced_matrix, complete_matrix):
+    """ Show the value of pairs of places (`place place value`),
+        and rows of places (`place row`) in the concurrency matrix.
+    """
+    # Usage error on unknown places (as `argparse`)
+    places = set(tfg.initial_net.places)
+    unknown_places = [place for place in [place for pair in args.pairs or [] for place in pair] + (args.rows or []) if place not in places]
+    if unknown_places:
+        print("{}: error: unknown places: {}".format(os.path.basename(sys.argv[0]), ', '.join(unknown_places)), file=sys.stderr)
+        exit(2)
+
+    if not complete_matrix:
+        # Case: partial relation, the whole matrix is computed once
+        matrix = tfg.concurrency_matrix(reduced_matrix, complete_matrix)
+        concurrent_places = lambda place_1, place_2: matrix.get(tfg.indices[place_1], tfg.indices[place_2])
+        concurrency_row = lambda place: ''.join(matrix.get(tfg.indices[place], j) for j in range(len(matrix)))
+    else:
+        concurrent_places = lambda place_1, place_2: tfg.concurrent_places(reduced_matrix, True, place_1, place_2)
+        concurrency_row = lambda place: tfg.concurrency_row(reduced_matrix, True, place)
+
+    for place_1, place_2 in args.pairs or []:
+        print(place_1, place_2, concurrent_places(place_1, place_2))
+
+    for place in args.rows or []:
+        row = concurrency_row(place)
+        print(place, row if args.no_rle else rle_encoding(row))
+
+
+def show_result(args, result, net, output=False, output_dead=False):
+    """ Show the concurrency matrix / dead places vector,
+        or both (the dead places vector being given by the diagonal of the concurrency matrix).
+        (written to the output files of the arguments by default)
+    """
+    if output is False:
+        output = args.output
+    if output_dead is False:
+        output_dead = getattr(args, 'output_dead', None)
+
+    if args.sub_parsers != 'both':
+        show_matrix(result, net, args.no_rle, args.place_names, output)
+        return
+
+    if output is None:
+        print("# Concurrency matrix")
+    show_matrix(result, net, args.no_rle, args.place_names, output)
+
+    if output_dead is None:
+        print("# Dead places vector")
+    show_matrix(dead_places_from_matrix(result), net, args.no_rle, args.place_names, output_dead)
+
+
+def anytime(args, caesar_option, computation, initial_net, reduced_net, reduced_nupn, tfg, deadline):
+    """ Anytime computation of the concurrency matrix / dead places vector:
+        run caesar.bdd with geometrically increasing time limits until the result is complete or the deadline is reached,
+        and show each improved result (or the newly decided cells only) after the change of dimension.
+    """
+    environment_timeout = os.getenv('CAESAR_BDD_TIMEOUT')
+
+    iteration, timeout, previous = 0, args.anytime_start, None
+    while True:
+        # The last time limit is bounded by the deadline
+        remaining = int(deadline - time.time())
+        if remaining < 1 and previous is not None:
+            break
+        os.environ['CAESAR_BDD_TIMEOUT'] = str(max(1, min(timeout, remaining)))
+        log.info("> Set environment variable CAESAR_BDD_TIMEOUT to `%s'", os.environ['CAESAR_BDD_TIMEOUT'])
+
+        reduced_matrix, complete_matrix = reduced_caesar_bdd(args, caesar_option, computation, reduced_net, reduced_nupn)
+
+        # Change of dimension (the state of the Token Flow Graph is reset)
+        tfg.init_state()
+        if args.sub_parsers == 'dead':
+            result = tfg.dead_places_vector(reduced_matrix, complete_matrix)
+        else:
+            result = tfg.concurrency_matrix(reduced_matrix, complete_matrix)
+
+        # Show the result if improved
+        cells = list(decided_cells(previous, result)) if previous is not None else None
+        if previous is None or cells:
+            iteration += 1
+            header = "# Iteration {}: CAESAR_BDD_TIMEOUT={} ({})\n".format(iteration, os.environ['CAESAR_BDD_TIMEOUT'], "complete" if complete_matrix else "partial")
+
+            if args.anytime_delta and previous is not None:
+                # Newly decided cells (`i j value` or `i value`)
+                sys.stdout.write(header)
+                sys.stdout.writelines(' '.join(initial_net.places[index] if args.place_names else str(index) for index in cell[:-1]) + ' ' + cell[-1] + '\n' for cell in cells)
+            elif args.output:
+                # Replace the output files at once, so that readers always get a whole result
+                print(header, end='', file=sys.stderr)
+                outputs = [args.output] + ([args.output_dead] if args.sub_parsers == 'both' and args.output_dead else [])
+                show_result(args, result, initial_net, *(output + '.tmp' for output in outputs))
+                for output in outputs:
+                    os.replace(output + '.tmp', output)
+            else:
+                sys.stdout.write(header)
+                show_result(args, result, initial_net, None, None)
+            sys.stdout.flush()
+
+        if complete_matrix:
+            break
+
+        previous, timeout = result, timeout * args.anytime_factor
+
+    # Restore the environment
+    if environment_timeout is None:
+        del os.environ['CAESAR_BDD_TIMEOUT']
+    else:
+        os.environ['CAESAR_BDD_TIMEOUT'] = environment_timeout
+
+
+def caesar_bdd_race(args, caesar_option, computation, reduced_net, reduced_nupn):
+    """ Run caesar.bdd on the reduced net and on the original net (*.nupn) concurrently,
+        and kill the loser.
+        Output: winner ('reduced' or 'original'), and its result.
+    """
+    def original():
+        matrix, complete_matrix = caesar_bdd(args.command_reduced, caesar_option, args.infile, get_cache(args), processes['original'])
+        return (matrix[0] if args.sub_parsers == 'dead' else matrix), complete_matrix
+
+    processes = {'reduced': ProcessGroup(), 'original': ProcessGroup()}
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = {
+            executor.submit(reduced_caesar_bdd, args, caesar_option, computation, reduced_net, reduced_nupn, processes['reduced']): 'reduced',
+            executor.submit(original): 'original'
+        }
+
+        # The first run to succeed wins (a failure leaves the other run alone)
+        pending, winner = set(futures), None
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    winner = future
+                    break
+                log.warning("> Caesar.bdd on the %s net failed", futures[future])
+
+        if winner is None:
+            # Both runs failed (raise the last error)
+            future.result()
+
+        # Kill the loser
+        for future, name in futures.items():
+            if future is not winner:
+                processes[name].kill()
+
+    return futures[winner], winner.result()
+
+
+class ProcessGroup:
+    """
+    Group of processes killed at once.
+
+    The processes registered after the kill are killed on registration.
+    """
+
+    def __init__(self):
+        """ Initializer.
+        """
+        self.processes = []
+        self.killed = threading.Event()
+
+    def register(self, process):
+        """ Add a process to the group.
+        """
+        self.processes.append(process)
+        if self.killed.is_set():
+            process.kill()
+
+    def kill(self):
+        """ Kill the processes of the group.
+        """
+        self.killed.set()
+        for process in list(self.processes):
+            process.kill()
+
+
 def reach(args):
     """ Marking reachability decision procedure.
     """
     # Quit if no marking specified
-    if args.marking is None:
+    if args.marking is None and args.markings is None:
         print("No marking specified.")
         return
 
     # Start time
     start_time = time.time()
 
-    # Set input file
-    infile = args.infile
-
-    # Read initial Petri net
-    log.info("> Read the input net")
-    initial_net = PetriNet(infile, initial_net=True)
-    infile = initial_net.f_file.name
+    if args.load_tfg:
+        # Load the Token Flow Graph (the input net is not read)
+        log.info("> Load the Token Flow Graph")
+        tfg = TFG.load(args.load_tfg)
+        initial_net, reduced_net = tfg.initial_net, tfg.reduced_net
+        reduced_net_filename, f_reduced_net = args.reduced_net, None
 
-    # Manage reduced net
-    f_reduced_net = None
-    if args.reduced_net:
-        reduced_net_filename = args.reduced_net
     else:
-        log.info("> Reduce the input net")
-        if args.save_reduced_net:
-            reduced_net_filename = args.infile.replace('.pnml', '_reduced.net')
+        # Manage reduced net
+        f_reduced_net = None
+        if args.reduced_net:
+            reduced_net_filename = args.reduced_net
         else:
-            f_reduced_net = tempfile.NamedTemporaryFile(suffix='.net')
-            reduced_net_filename = f_reduced_net.name
+            if args.save_reduced_net:
+                reduced_net_filename = args.infile.replace('.pnml', '_reduced.net')
+            else:
+                f_reduced_net = tempfile.NamedTemporaryFile(suffix='.net')
+                reduced_net_filename = f_reduced_net.name
 
-        reduction_time = time.time()
-        if not args.shrink and which("reduce") is not None:
-            subprocess.run(["reduce", "-rg,redundant,compact,4ti2", "-redundant-limit", "650", "-redundant-time", "10", "-inv-limit", "1000", "-inv-time", "10", "-PNML", infile, reduced_net_filename], check=True)
-        else:
-            subprocess.run(["shrink", "--equations", "--clean", "--redundant", "--compact", "-i", infile, "-o", reduced_net_filename], check=True)
+        # Read initial Petri net while reducing it
+        log.info("> Read and reduce the input net")
+        initial_net, reduction_time, engine = run_until_complete(read_and_reduce(args, args.infile, None if args.reduced_net else reduced_net_filename))
 
+        # Show the time spent normalizing the place names if option enabled
         if args.time:
-            print("# Reduction time:", time.time() - reduction_time)
+            show_normalization_time(initial_net)
+            if not args.reduced_net:
+                print("# Reduction time:", reduction_time)
+                if args.portfolio:
+                    print("# Reduction engine:", engine)
 
-    # Read reduced net
-    log.info("> Read the reduced net")
-    reduced_net = PetriNet(reduced_net_filename)
+        # Read reduced net
+        log.info("> Read the reduced net")
+        reduced_net = PetriNet(reduced_net_filename)
 
-    # Show reduction ratio if option enabled
-    if args.show_reduction_ratio:
-        print("# Reduction ratio:", (1 - reduced_net.number_places / initial_net.number_places) * 100, file=sys.stderr)
+        # Show reduction ratio if option enabled
+        if args.show_reduction_ratio:
+            print("# Reduction ratio:", (1 - reduced_net.number_places / initial_net.number_places) * 100, file=sys.stderr)
 
-    # Build the Token Flow Graph
-    log.info("> Build the Token Flow Graph")
-    tfg = TFG(reduced_net_filename, initial_net, reduced_net, args.show_equations)
+        # Build the Token Flow Graph
+        log.info("> Build the Token Flow Graph")
+        tfg = TFG(reduced_net_filename, initial_net, reduced_net, args.show_equations)
+
+        # Save the Token Flow Graph if option enabled
+        if args.save_tfg:
+            log.info("> Save the Token Flow Graph")
+            tfg.save(args.save_tfg)
 
     # Draw graph if option enabled
     if args.draw_graph:
         tfg.draw_graph()
 
-    # Read marking
+    # Read markings
     log.info("> Read the marking")
-    with open(args.marking) as fp:
-        marking_str = fp.read()
-    marking = marking_parser(marking_str)
+    if args.markings:
+        markings = markings_parser(args.markings)
+    else:
+        with open(args.marking) as fp:
+            markings = [(None, marking_parser(fp.read()))]
 
-    # Project marking
+    # Project markings (identical projections are checked once)
     log.info("> Project the marking")
-    reduced_marking = tfg.marking_projection(marking)
-
-    if reduced_marking is None:
-        # Case: no possible projection
-        print("UNREACHABLE")
-        sift_time = 0
-    elif not reduced_marking:
-        # Case: tautological projection
-        print("REACHABLE")
-        sift_time = 0
-    else:
-        # Case: projection to check
-        formula = '- (' + ' /\ '.join('{} = {}'.format(place if '-' not in place and '.' not in place else "{{{}}}".format(place), tokens) for place, tokens in reduced_marking.items()) + ')'
-        
-        if args.show_projected_marking:
-            print("# Projected marking:", formula, file=sys.stderr)
+    verdicts, formulas = [], {}
+    for name, marking in markings:
+        reduced_marking = tfg.marking_projection(marking)
+
+        if reduced_marking is None:
+            # Case: no possible projection
+            verdicts.append((name, False))
+        elif not reduced_marking:
+            # Case: tautological projection
+            verdicts.append((name, True))
+        else:
+            # Case: projection to check
+            formula = projection_formula(reduced_marking)
 
+            if args.show_projected_marking:
+                print("# Projected marking{}:".format(' ' + name if name is not None else ''), formula, file=sys.stderr)
+
+            verdicts.append((name, formula))
+            formulas[formula] = None
+
+    # Query to sift (bounded number of concurrent processes)
+    sift_time = time.time()
+    if formulas:
         log.info("> Query to sift")
-        with tempfile.NamedTemporaryFile(mode="w+t") as tmp:
-            tmp.writelines(formula)
-            tmp.seek(0)
-            sift_time = time.time()
-            sift = subprocess.run(["sift", reduced_net_filename, "-ff", tmp.name], stdout=subprocess.PIPE, check=True)
-        sift_time = time.time() - sift_time
-        if "some state violates condition -f:" == sift.stdout.decode('utf-8').splitlines()[0]:
-            print("REACHABLE")
-        else:
-            print("UNREACHABLE")
+        formulas = dict(zip(formulas, run_until_complete(sift_all(reduced_net_filename, list(formulas), args.jobs))))
+    sift_time = time.time() - sift_time
+
+    # Show verdicts
+    for name, verdict in verdicts:
+        if isinstance(verdict, str):
+            verdict = formulas[verdict]
+        print("{}{}".format(name + ' ' if name is not None else '', "REACHABLE" if verdict else "UNREACHABLE"))
 
     # Show computation time
     if args.time:
@@ -341,6 +919,55 @@ def reach(args):
         f_reduced_net.close()
 
 
+def projection_formula(reduced_marking):
+    """ Return the negation of a projected marking as a sift formula.
+    """
+    return '- (' + ' /\\ '.join('{} = {}'.format(place if '-' not in place and '.' not in place else "{{{}}}".format(place), tokens) for place, tokens in reduced_marking.items()) + ')'
+
+
+async def sift(net_filename, formula, semaphore):
+    """ Check with sift if the negation of a formula is satisfied by some reachable state.
+        (the formula being the negation of a marking)
+    """
+    async with semaphore:
+        with tempfile.NamedTemporaryFile(mode="w+t") as tmp:
+            tmp.writelines(formula)
+            tmp.seek(0)
+            process = await asyncio.create_subprocess_exec("sift", net_filename, "-ff", tmp.name, stdout=subprocess.PIPE)
+            stdout, _ = await process.communicate()
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, "sift")
+
+    return "some state violates condition -f:" == stdout.decode('utf-8').splitlines()[0]
+
+
+async def sift_all(net_filename, formulas, jobs):
+    """ Check formulas with concurrent sift processes.
+        (at most `jobs` at a time)
+    """
+    semaphore = asyncio.Semaphore(jobs)
+    return await asyncio.gather(*(sift(net_filename, formula, semaphore) for formula in formulas))
+
+
+def serve(args):
+    """ Kong daemon wrapper.
+    """
+    # Configure verbosity
+    if args.verbose:
+        log.basicConfig(format="%(message)s", level=log.DEBUG)
+    else:
+        log.basicConfig(format="%(message)s")
+
+    # Imported here, the server module depends on this one
+    from server import serve as serve_forever
+    try:
+        serve_forever(args.socket, args.max_memory * 2 ** 20, args.cache_dir, args.cache_size)
+    except FileExistsError as error:
+        log.error("> %s", error)
+        exit(1)
+
+
 def main():
     """ Main Function.
     """
@@ -364,6 +991,24 @@ def main():
                                action='store_true',
                                help='use the Shrink reduction tool')
 
+    parent_parser.add_argument('-pf', '--portfolio',
+                               action='store_true',
+                               help='race the available reduction tools and keep the first to finish')
+
+    parent_parser.add_argument('--portfolio-time',
+                               action='store',
+                               dest='portfolio_time',
+                               type=float,
+                               help='keep the best reduction ratio among the tools finished within a time budget in seconds (portfolio mode)')
+
+    parent_parser.add_argument('--portfolio-reduce-options',
+                               action='append',
+                               dest='portfolio_reduce_options',
+                               type=str,
+                               metavar='OPTIONS',
+                               help="add a run of reduce with the given options to the portfolio (can be repeated, "
+                                    "use the `=' form as the options start with a dash, e.g. --portfolio-reduce-options='-rg,redundant')")
+
     group_reductions = parent_parser.add_mutually_exclusive_group()
 
     group_reductions.add_argument('-sr', '--save-reduced-net',
@@ -376,6 +1021,19 @@ def main():
                                   type=str,
                                   help='specify reduced Petri net (.net format)')
 
+    parent_parser.add_argument('--cache-dir',
+                               action='store',
+                               dest='cache_dir',
+                               type=str,
+                               help='cache the reduced nets and the caesar.bdd results in a directory')
+
+    parent_parser.add_argument('--cache-size',
+                               action='store',
+                               dest='cache_size',
+                               type=int,
+                               default=1024,
+                               help='set the maximal size of the cache in MB (default: 1024)')
+
     parent_parser.add_argument('-t', '--time',
                                action='store_true',
                                help='show the computation time')
@@ -411,6 +1069,12 @@ def main():
                                   action='store_true',
                                   help='show place names')
 
+    conc_dead_parser.add_argument('-o', '--output',
+                                  action='store',
+                                  dest='output',
+                                  type=str,
+                                  help='write the concurrency matrix or the dead places vector to a file')
+
     conc_dead_parser.add_argument('-sn', '--show-nupns',
                                   action='store_true',
                                   help='show the NUPNs')
@@ -428,6 +1092,38 @@ def main():
                                   help='set the command for computing the reduced concurrncy matrix or the reduced dead vector',
                                   default='caesar.bdd')
 
+    conc_dead_parser.add_argument('-ns', '--no-split',
+                                  action='store_true',
+                                  help='run a single caesar.bdd on the whole reduced net instead of one per connected component')
+
+    conc_dead_parser.add_argument('-ro', '--race-original',
+                                  action='store_true',
+                                  help='race caesar.bdd on the reduced net and on the original net (.nupn input only), keeping the first to finish')
+
+    conc_dead_parser.add_argument('--anytime',
+                                  action='store',
+                                  dest='anytime',
+                                  type=float,
+                                  help='refine the partial result with increasing caesar.bdd time limits until a deadline in seconds, showing each improved result')
+
+    conc_dead_parser.add_argument('--anytime-start',
+                                  action='store',
+                                  dest='anytime_start',
+                                  type=int,
+                                  default=1,
+                                  help='set the first caesar.bdd time limit in seconds of the anytime mode (default: 1)')
+
+    conc_dead_parser.add_argument('--anytime-factor',
+                                  action='store',
+                                  dest='anytime_factor',
+                                  type=int,
+                                  default=2,
+                                  help='set the growth factor of the caesar.bdd time limits of the anytime mode (default: 2)')
+
+    conc_dead_parser.add_argument('--anytime-delta',
+                                  action='store_true',
+                                  help='only show the newly decided cells after the first result of the anytime mode')
+
     conc_dead_parser.add_argument('--bdd-timeout',
                                   action='store',
                                   dest='bdd_timeout',
@@ -448,6 +1144,23 @@ def main():
                               type=str,
                               help='specify reduced concurrency matrix (or dead places vector) file')
 
+    parser_conc.add_argument('--pair',
+                              action='append',
+                              dest='pairs',
+                              nargs=2,
+                              metavar=('PLACE', 'PLACE'),
+                              help='only show the value of a pair of places in the concurrency matrix (can be repeated)')
+
+    parser_conc.add_argument('--row',
+                              action='append',
+                              dest='rows',
+                              metavar='PLACE',
+                              help='only show the row of a place in the concurrency matrix (can be repeated)')
+
+    parser_conc.add_argument('-fo', '--factored',
+                              action='store_true',
+                              help='show the concurrency relation as products of successors in the Token Flow Graph (complete reduced matrix only)')
+
     parser_conc.add_argument('-srm', '--show-reduced-matrix',
                               action='store_true',
                               dest='show_reduced_result',
@@ -466,6 +1179,25 @@ def main():
                              dest='show_reduced_result',
                              help='show the reduced vector')
 
+    parser_both = sub_parsers.add_parser('both', parents=[parent_parser, conc_dead_parser], help='Concurrent and dead places computation (dead places given by the concurrency matrix)')
+
+    parser_both.add_argument('-od', '--output-dead',
+                             action='store',
+                             dest='output_dead',
+                             type=str,
+                             help='write the dead places vector to a file')
+
+    parser_both.add_argument('-rm', '--reduced-matrix',
+                             action='store',
+                             dest='reduced_result',
+                             type=str,
+                             help='specify reduced concurrency matrix file')
+
+    parser_both.add_argument('-srm', '--show-reduced-matrix',
+                             action='store_true',
+                             dest='show_reduced_result',
+                             help='show the reduced matrix')
+
     parser_reach = sub_parsers.add_parser('reach', parents=[parent_parser], help='Marking reachability decision')
 
     parser_reach.add_argument('infile',
@@ -473,18 +1205,87 @@ def main():
                               type=str,
                               help='input Petri net (.pnml or .net format)')
 
-    parser_reach.add_argument('-m', '--marking',
+    group_markings = parser_reach.add_mutually_exclusive_group()
+
+    group_markings.add_argument('-m', '--marking',
+                                action='store',
+                                dest='marking',
+                                type=str,
+                                help='marking')
+
+    group_markings.add_argument('-ms', '--markings',
+                                action='store',
+                                dest='markings',
+                                type=str,
+                                help='set of markings (directory of marking files, or file with one marking per line)')
+
+    parser_reach.add_argument('-j', '--jobs',
+                              action='store',
+                              dest='jobs',
+                              type=int,
+                              default=os.cpu_count() or 1,
+                              help='set the maximal number of concurrent sift processes (default: number of CPUs)')
+
+    parser_reach.add_argument('-st', '--save-tfg',
+                              action='store',
+                              dest='save_tfg',
+                              type=str,
+                              help='save a snapshot of the Token Flow Graph')
+
+    parser_reach.add_argument('-lt', '--load-tfg',
                               action='store',
-                              dest='marking',
+                              dest='load_tfg',
                               type=str,
-                              help='marking')
+                              help='load a snapshot of the Token Flow Graph instead of reading the input net (requires --reduced-net)')
 
     parser_reach.add_argument('-sf', '--show-projected-marking',
                               action='store_true',
                               help='show the projected marking')
 
+    parser_serve = sub_parsers.add_parser('serve', help='Daemon answering JSON requests on a Unix domain socket')
+
+    parser_serve.add_argument('socket',
+                              metavar='socket',
+                              type=str,
+                              help='path of the Unix domain socket')
+
+    parser_serve.add_argument('-v', '--verbose',
+                              action='store_true',
+                              help='increase output verbosity')
+
+    parser_serve.add_argument('--max-memory',
+                              action='store',
+                              dest='max_memory',
+                              type=int,
+                              default=1024,
+                              help='set the maximal memory footprint of the loaded nets in MB (default: 1024)')
+
+    parser_serve.add_argument('--cache-dir',
+                              action='store',
+                              dest='cache_dir',
+                              type=str,
+                              help='cache the reduced nets and the caesar.bdd results in a directory')
+
+    parser_serve.add_argument('--cache-size',
+                              action='store',
+                              dest='cache_size',
+                              type=int,
+                              default=1024,
+                              help='set the maximal size of the cache in MB (default: 1024)')
+
     args = parser.parse_args()
 
+    if getattr(args, 'load_tfg', None) and not args.reduced_net:
+        parser.error("--load-tfg requires --reduced-net")
+
+    if (getattr(args, 'portfolio_time', None) is not None or getattr(args, 'portfolio_reduce_options', None)) and not args.portfolio:
+        parser.error("--portfolio-time and --portfolio-reduce-options require --portfolio")
+
+    if getattr(args, 'anytime', None):
+        conflicts = [option for option, dest in (('--factored', 'factored'), ('--pair', 'pairs'), ('--row', 'rows'), ('--race-original', 'race_original'), ('-rm', 'reduced_result')) if getattr(args, dest, None)]
+        if conflicts:
+            parser.error("--anytime cannot be used with {}".format(', '.join(conflicts)))
+
     # Call corresponding function
     sub_parsers = args.sub_parsers
     if sub_parsers is None:
@@ -494,6 +1295,5 @@ def main():
 
 
 if __name__ == '__main__':
-    sys.setrecursionlimit(10000)
     main()
     exit(0)
@@ -0,0 +1,181 @@
+"""
+Concurrency Matrix Module
+
+Compact lower-triangular matrix storing one relation value (`0`, `1` or `.`)
+per pair of places.
+
+This file is part of Kong.
+
+Kong is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Kong is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Kong. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Nicolas AMAT, LAAS-CNRS"
+__contact__ = "namat@laas.fr"
+__license__ = "GPLv3"
+__version__ = "2.0.0"
+
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import product
+
+# Two bits per cell: the low bit is set if the value is known,
+# the high bit is set if the places are concurrent (non-dead on the diagonal)
+ENCODING = {'.': 0b00, '0': 0b01, '1': 0b11}
+DECODING = '.0.1'
+
+# Four cells per byte
+CELLS_PER_BYTE = 4
+
+# Bytes filled with a single value
+FILLING = {value: code * 0b01010101 for value, code in ENCODING.items()}
+
+# A row of a cartesian product is set cell by cell when it contains less
+# than `SPARSE_CELLS + span // SPARSE_BYTES` cells, otherwise the whole byte span
+# is updated at once
+SPARSE_CELLS = 4
+SPARSE_BYTES = 256
+
+# Decoded values of each byte
+BYTE_DECODING = [''.join(DECODING[(byte >> (2 * k)) & 0b11] for k in range(CELLS_PER_BYTE)) for byte in range(256)]
+
+
+class TriangularMatrix:
+    """
+    Lower-triangular matrix packed in a bytearray.
+
+    Row `i` holds the cells `(i, 0)` to `(i, i)`,
+    and starts on a byte boundary.
+    """
+
+    def __init__(self, size, value='.'):
+        """ Initializer.
+        """
+        # Number of rows
+        self.size = size
+
+        # Byte offset of each row (and end of the data)
+        self.offsets = array('Q', [0])
+        for i in range(size):
+            self.offsets.append(self.offsets[-1] + i // CELLS_PER_BYTE + 1)
+
+        # Packed cells
+        self.data = bytearray([FILLING[value]]) * self.offsets[-1]
+
+    def __len__(self):
+        """ Number of rows.
+        """
+        return self.size
+
+    def __iter__(self):
+        """ Iterate over the decoded rows.
+        """
+        for i in range(self.size):
+            yield self.row(i)
+
+    def get(self, i, j):
+        """ Return the value of the cell `(i, j)`.
+        """
+        if i < j:
+            i, j = j, i
+
+        byte = self.data[self.offsets[i] + j // CELLS_PER_BYTE]
+        return DECODING[(byte >> (2 * (j % CELLS_PER_BYTE))) & 0b11]
+
+    def set(self, i, j, value):
+        """ Set the value of the cell `(i, j)`.
+        """
+        if i < j:
+            i, j = j, i
+
+        index, shift = self.offsets[i] + j // CELLS_PER_BYTE, 2 * (j % CELLS_PER_BYTE)
+        self.data[index] = (self.data[index] & ~(0b11 << shift)) | (ENCODING[value] << shift)
+
+    def set_product(self, rows, columns, value):
+        """ Set the cells of the cartesian product between
+            two collections of indices to a value.
+        """
+        if len(rows) * len(columns) <= SPARSE_CELLS * SPARSE_CELLS:
+            for i, j in product(rows, columns):
+                self.set(i, j, value)
+            return
+
+        rows, columns = sorted(set(rows)), sorted(set(columns))
+
+        # Cells `(i, j)` with `j <= i` for `i` in `rows`, and `j < i` for `i` in `columns`
+        self.set_block(rows, columns, value, bisect_right)
+        self.set_block(columns, rows, value, bisect_left)
+
+    def set_block(self, rows, columns, value, bisect=bisect_right):
+        """ Set the cells `(i, j)` of the lower triangle to a value,
+            for `i` in `rows` and `j` in the prefix of `columns` given by `bisect(columns, i)`.
+            (`rows` and `columns` must be sorted)
+        """
+        if not rows or not columns:
+            return
+
+        # Mask of the columns, starting at the byte of the first column
+        start = columns[0] // CELLS_PER_BYTE
+        mask = bytearray(columns[-1] // CELLS_PER_BYTE - start + 1)
+        for j in columns:
+            mask[j // CELLS_PER_BYTE - start] |= 1 << (2 * (j % CELLS_PER_BYTE))
+
+        code = ENCODING[value]
+
+        for i in rows:
+            number_cells = bisect(columns, i)
+            if not number_cells:
+                continue
+
+            span = columns[number_cells - 1] // CELLS_PER_BYTE - start + 1
+
+            # Sparse row: set cell by cell
+            if number_cells <= SPARSE_CELLS + span // SPARSE_BYTES:
+                for j in columns[:number_cells]:
+                    self.set(i, j, value)
+                continue
+
+            # Dense row: update the whole span at once
+            # (the last byte may contain cells beyond the diagonal, which are only padding)
+            offset = self.offsets[i] + start
+            known = int.from_bytes(mask[:span], 'little')
+            cells = int.from_bytes(self.data[offset:offset + span], 'little')
+            if code == ENCODING['1']:
+                cells |= known * 0b11
+            elif code == ENCODING['0']:
+                cells = (cells | known) & ~(known << 1)
+            else:
+                cells &= ~(known * 0b11)
+            self.data[offset:offset + span] = cells.to_bytes(span, 'little')
+
+    def fill_row(self, i, value):
+        """ Set all the cells of row `i` to a value.
+        """
+        start, end = self.offsets[i], self.offsets[i + 1]
+        self.data[start:end] = bytes([FILLING[value]]) * (end - start)
+
+    def fill_column(self, j, value):
+        """ Set all the cells of column `j` below the diagonal to a value.
+        """
+        for i in range(j + 1, self.size):
+            self.set(i, j, value)
+
+    def diagonal(self):
+        """ Return the diagonal as a string.
+        """
+        return ''.join(self.get(i, i) for i in range(self.size))
+
+    def row(self, i):
+        """ Return row `i` as a string.
+        """
+        return ''.join(map(BYTE_DECODING.__getitem__, self.data[self.offsets[i]:self.offsets[i + 1]]))[:i + 1]
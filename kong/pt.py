@@ -22,11 +22,20 @@ __contact__ = "namat@laas.fr"
 __license__ = "GPLv3"
 __version__ = "2.0.0"
 
+import itertools
 import os.path
-import re
 import tempfile
+import time
 import xml.etree.ElementTree as ET
 from collections import deque
+from xml.parsers import expat
+
+# Braces surrounding identifiers in .net files
+BRACES = str.maketrans('', '', '{}')
+
+# Entities to escape in text and attribute values
+TEXT_ESCAPE = str.maketrans({'&': "&amp;", '<': "&lt;", '>': "&gt;"})
+ATTRIBUTE_ESCAPE = str.maketrans({'&': "&amp;", '<': "&lt;", '>': "&gt;", '"': "&quot;", '\n': "&#10;", '\r': "&#13;", '\t': "&#9;"})
 
 
 class PetriNet:
@@ -60,7 +69,12 @@ class PetriNet:
         # Current file
         self.f_file = None
 
-        # Parse file
+        # Time spent writing the normalized copy of the .pnml file (None if not needed)
+        self.normalization_time = None
+
+        # Parse file (no file for subnets)
+        if filename is None:
+            return
         extension = os.path.splitext(filename)[1]
         if extension == '.pnml':
             self.parse_pnml(filename, no_units)
@@ -77,115 +91,138 @@ class PetriNet:
     def parse_pnml(self, filename, no_units):
         """ Petri Net parser.
             Input format: .pnml
+            (streaming parser, the children of the pages are freed once parsed)
         """
         xmlns = "{http://www.pnml.org/version-2009/grammar/pnml}"
-        ET.register_namespace('', "http://www.pnml.org/version-2009/grammar/pnml")
+        place_tag, page_tag = xmlns + "place", xmlns + "page"
+        structure_path = [xmlns + tag for tag in ["pnml", "net", "page", "toolspecific", "structure"]]
 
-        tree = ET.parse(filename)
-        root = tree.getroot()
+        # Parse the NUPN information only for the initial net
+        parse_structure = self.initial_net and not no_units
 
-        for place_node in root.iter(xmlns + "place"):
+        # Flag indicating if the `name/text` element of a place differs from its id
+        renaming = False
 
-            if self.initial_net:
-                # If initial net, assume there is no `name/text` element
-                place = place_node.attrib['id']
+        # Stack of the open elements
+        stack = []
 
-                # Check if there exists one
-                text_element = place_node.find(xmlns + "name/" + xmlns + "text")
-                if text_element is not None:
-                    # If it is the case, set its value to the id
-                    text_element.text = place
-                else:
-                    # If not, create one
-                    name = ET.SubElement(place_node, 'name')
-                    text = ET.SubElement(name, 'text')
-                    text.text = place
+        for event, element in ET.iterparse(filename, events=('start', 'end')):
 
-            else:
-                # If reduced net, take the `name/text` element instead
-                place = place_node.find(xmlns + "name/" + xmlns + "text").text
+            if event == 'start':
+                stack.append(element)
+                continue
+
+            stack.pop()
 
-            self.places.append(place)
-            self.order[place] = self.number_places
-            self.number_places += 1
+            if element.tag == place_tag:
+
+                if self.initial_net:
+                    # If initial net, take the id (the `name/text` element is normalized when writing the net)
+                    place = element.attrib['id']
+                    if not renaming:
+                        renaming = element.findtext(xmlns + "name/" + xmlns + "text") != place
+                else:
+                    # If reduced net, take the `name/text` element instead
+                    place = element.find(xmlns + "name/" + xmlns + "text").text
 
-        if self.initial_net and not no_units:
-            # Write the net to a temporary file
+                self.places.append(place)
+                self.order[place] = self.number_places
+                self.number_places += 1
+
+                # Get initial marking
+                marking = element.find(xmlns + "initialMarking/" + xmlns + "text")
+                if marking is not None and int(marking.text):
+                    self.initial_places.append(place)
+
+            elif parse_structure and element.tag == structure_path[-1] and [ancestor.tag for ancestor in stack] == structure_path[:-1]:
+                # Only consider the first NUPN structure
+                parse_structure = False
+                self.parse_nupn(element, xmlns)
+
+            # Free the children of the pages once parsed
+            if stack and stack[-1].tag == page_tag:
+                del stack[-1][-1]
+
+        if self.initial_net and not no_units and renaming:
+            # Write the net with place names equal to ids to a temporary file
+            start_time = time.time()
             self.f_file = tempfile.NamedTemporaryFile(suffix='.pnml')
-            tree.write(self.f_file.name, encoding="utf-8", xml_declaration=True)
+            PnmlWriter(self.f_file).write(filename)
+            self.normalization_time = time.time() - start_time
 
-            # Check if the net is known to be unit-safe
-            structure = root.find(xmlns + "net/" + xmlns + "page/" + xmlns + "toolspecific/" + xmlns + "structure")
+    def parse_nupn(self, structure, xmlns):
+        """ NUPN parser.
+            Input format: `toolspecific/structure` element of a .pnml
+        """
+        # Get unit safe pragma
+        unit_safe = structure.attrib["safe"] == "true"
 
-            # Exit if no NUPN inforation
-            if structure is None:
-                return
+        # Create NUPN
+        self.nupn = NUPN(unit_safe)
 
-            # Get unit safe pragma
-            unit_safe = structure.attrib["safe"] == "true"
-            
-            # Create NUPN
-            self.nupn = NUPN(unit_safe)
+        # Get root unit
+        self.nupn.root = self.nupn.get_unit(structure.attrib["root"])
 
-            # Get root unit
-            self.nupn.root = self.nupn.get_unit(structure.attrib["root"])
+        # Get NUPN information
+        for unit in structure.findall(xmlns + 'unit'):
+            # Get name
+            name = unit.attrib["id"]
 
-            # Get NUPN information
-            for unit in structure.findall(xmlns + 'unit'):
-                # Get name
-                name = unit.attrib["id"]
+            # Get places
+            pnml_places = unit.find(xmlns + 'places')
+            places = [place for place in pnml_places.text.split()] if pnml_places is not None and pnml_places.text else []
 
-                # Get places
-                pnml_places = unit.find(xmlns + 'places')
-                places = [place for place in pnml_places.text.split()] if pnml_places is not None and pnml_places.text else []
+            # Get subunits
+            pnml_subunits = unit.find(xmlns + 'subunits')
+            subunits = {self.nupn.get_unit(subunit) for subunit in pnml_subunits.text.split()} if pnml_subunits is not None and pnml_subunits.text else set()
 
-                # Get subunits
-                pnml_subunits = unit.find(xmlns + 'subunits')
-                subunits = {self.nupn.get_unit(subunit) for subunit in pnml_subunits.text.split()} if pnml_subunits is not None and pnml_subunits.text else set()
-                
-                # Create new unit
-                new_unit = self.nupn.get_unit(name)
-                new_unit.places = places
-                new_unit.subunits = subunits
+            # Create new unit
+            new_unit = self.nupn.get_unit(name)
+            new_unit.places = places
+            new_unit.subunits = subunits
 
-            # Set successors
-            self.nupn.root.compute_hierarchy()
+        # Set successors
+        self.nupn.root.compute_hierarchy()
 
     def parse_net(self, filename):
         """ Petri Net parser.
             Input format: .net
+            (the file is tokenized in bulk, places are indexed in `self.order`)
         """
         try:
             with open(filename, 'r') as fp:
-                for line in fp.readlines():
+                lines = fp.read().splitlines()
+        except FileNotFoundError as e:
+            exit(e)
 
-                    content = re.split(r'\s+', line.strip())  
+        for line in lines:
 
-                    # Skip empty lines and get the first identifier
-                    if not content:
-                        continue
-                    else:
-                        element = content.pop(0)
+            # Skip equations and comments
+            if line.startswith('#'):
+                continue
 
-                    # Transition arcs
-                    if element == "tr":
-                        self.parse_transition(content)
+            # Skip empty lines
+            content = line.split()
+            if not content:
+                continue
 
-                    # Place
-                    if element == "pl":
-                        self.parse_place(content)
-            fp.close()
-            self.number_places = len(self.places)
-        except FileNotFoundError as e:
-            exit(e)
+            # Transition arcs
+            if content[0] == "tr":
+                self.parse_transition(content)
+
+            # Place
+            elif content[0] == "pl":
+                self.parse_place(content)
+
+        self.number_places = len(self.places)
 
     def parse_transition(self, content):
         """ Transition parser.
             Input format: .net
         """
-        transition = content.pop(0).replace('{', '').replace('}', '')
+        transition = content[1].translate(BRACES)
 
-        content = self.parse_label(content)
+        content = self.parse_label(content[2:])
         arrow = content.index("->")
 
         self.pre[transition] = [self.parse_arc(arc) for arc in content[0:arrow]]
@@ -195,13 +232,10 @@ class PetriNet:
         """ Arc parser.
             Input format: .net
         """
-        if '*' in content:
-            place = content.split('*')[0].replace('{', '').replace('}', '')
-        else:
-            place = content.replace('{', '').replace('}', '')
+        place = content.partition('*')[0].translate(BRACES)
 
-        if place not in self.places:
-                self.places.append(place)
+        if place not in self.order:
+            self.add_place(place)
 
         return place
 
@@ -209,14 +243,20 @@ class PetriNet:
         """ Place parser.
             Input format: .net
         """
-        place = content[0].replace('{', '').replace('}', '')
+        place = content[1].translate(BRACES)
 
-        if place not in self.places:
-            self.places.append(place)
+        if place not in self.order:
+            self.add_place(place)
 
-        if len(content) > 1 and content[1] == "(1)":
+        if len(content) > 2 and content[2] == "(1)":
             self.initial_places.append(place)
 
+    def add_place(self, place):
+        """ Add a new place.
+        """
+        self.order[place] = len(self.places)
+        self.places.append(place)
+
     def parse_label(self, content):
         """ Label parser.
             Input format: .net
@@ -230,6 +270,55 @@ class PetriNet:
                 index += 1
         return content[index:]
 
+    def connected_components(self):
+        """ Compute the place-disjoint connected components,
+            two places being connected if they share a transition.
+            (the places of each component are in the order of the net)
+        """
+        # Union-find forest
+        parents = {place: place for place in self.places}
+
+        def find(place):
+            while parents[place] != place:
+                parents[place] = parents[parents[place]]
+                place = parents[place]
+            return place
+
+        for transition, pre in self.pre.items():
+            root = None
+            for place in itertools.chain(pre, self.post[transition]):
+                if root is None:
+                    root = find(place)
+                else:
+                    parents[find(place)] = root
+
+        components = {}
+        for place in self.places:
+            components.setdefault(find(place), []).append(place)
+
+        return list(components.values())
+
+    def subnet(self, places):
+        """ Return the subnet induced by a union of connected components.
+        """
+        subnet = PetriNet(None)
+        places_set = set(places)
+
+        subnet.places = list(places)
+        subnet.number_places = len(subnet.places)
+        subnet.initial_places = [place for place in self.initial_places if place in places_set]
+
+        # All the places of a transition belong to the same component
+        for transition, pre in self.pre.items():
+            post = self.post[transition]
+            if (pre and pre[0] in places_set) or (post and post[0] in places_set):
+                subnet.pre[transition], subnet.post[transition] = pre, post
+
+        if self.nupn:
+            subnet.nupn = self.nupn.restriction(places_set)
+
+        return subnet
+
     def export_nupn(self, filename):
         """ Export NUPN.
             Format: .nupn
@@ -262,7 +351,7 @@ class PetriNet:
                     number_places = len(unit.places)
                     start, end = (self.order[unit.places[-1]], self.order[unit.places[0]]) if number_places else (1, 0)
             
-                    subunits = ' ' + ' '.join(map(lambda subunit: str(subunit.index), unit.subunits)) if unit.subunits else ""
+                    subunits = ' ' + ' '.join(map(str, sorted(subunit.index for subunit in unit.subunits))) if unit.subunits else ""
 
                     fp.write("U{} #{} {}...{} #{}{}\n".format(unit.index, number_places, start, end, len(unit.subunits), subunits))
 
@@ -282,6 +371,119 @@ class PetriNet:
                 post = ' ' + ' '.join(map(lambda pl: str(self.order[pl]), self.post[transition])) if self.post[transition] else ""
                 fp.write("T{} #{}{} #{}{}\n".format(index, len(self.pre[transition]), pre, len(self.post[transition]), post))
 
+class PnmlWriter:
+    """
+    Streaming copy of a .pnml file,
+    setting the `name/text` element of each place to its id.
+    (missing `name/text` elements are created)
+    """
+
+    # Number of pending chunks before writing them
+    BUFFER_SIZE = 1 << 14
+
+    def __init__(self, output):
+        """ Initializer.
+        """
+        # Binary output file
+        self.output = output
+
+        # Pending chunks of text
+        self.chunks = []
+
+        # Local names of the open elements
+        self.path = []
+
+        # Id and prefix of the current place
+        self.place, self.prefix = None, ''
+
+        # Flags indicating if the current place has a `name/text` element, and if it is the current element
+        self.named, self.in_name = False, False
+
+        # Flag indicating if the last start tag is not closed yet (empty elements are written as `<tag/>`)
+        self.open_tag = False
+
+    def write(self, filename):
+        """ Copy the .pnml file.
+        """
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.ordered_attributes = True
+        parser.StartElementHandler = self.start_element
+        parser.EndElementHandler = self.end_element
+        parser.CharacterDataHandler = self.characters
+
+        self.chunks.append('<?xml version="1.0" encoding="utf-8"?>\n')
+        with open(filename, 'rb') as fp:
+            parser.ParseFile(fp)
+        self.flush()
+
+    def flush(self):
+        """ Write the pending chunks.
+        """
+        self.output.write(''.join(self.chunks).encode('utf-8'))
+        self.output.flush()
+        self.chunks = []
+
+    def start_element(self, name, attributes):
+        """ Open an element.
+        """
+        if self.open_tag:
+            self.chunks.append('>')
+
+        local_name = name.rpartition(':')[2]
+
+        if local_name == 'place':
+            self.place, self.prefix, self.named = attributes[attributes.index('id') + 1], name[:-len('place')], False
+        elif local_name == 'text' and self.place is not None and self.path[-2:] == ['place', 'name']:
+            self.named, self.in_name = True, True
+
+        self.path.append(local_name)
+
+        tag = '<' + name
+        for index in range(0, len(attributes), 2):
+            tag += ' ' + attributes[index] + '="' + attributes[index + 1].translate(ATTRIBUTE_ESCAPE) + '"'
+        self.chunks.append(tag)
+        self.open_tag = True
+
+        if self.in_name:
+            self.chunks.append('>' + self.place.translate(TEXT_ESCAPE))
+            self.open_tag = False
+
+    def characters(self, content):
+        """ Copy text, except for the place names.
+        """
+        if not self.in_name:
+            if self.open_tag:
+                self.chunks.append('>')
+                self.open_tag = False
+            self.chunks.append(content.translate(TEXT_ESCAPE))
+
+    def end_element(self, name):
+        """ Close an element.
+        """
+        local_name = self.path.pop()
+
+        if local_name == 'place':
+            # Create a `name/text` element if there is none
+            if not self.named:
+                if self.open_tag:
+                    self.chunks.append('>')
+                    self.open_tag = False
+                self.chunks.append('<{0}name><{0}text>{1}</{0}text></{0}name>'.format(self.prefix, self.place.translate(TEXT_ESCAPE)))
+            self.place = None
+
+        self.in_name = False
+
+        if self.open_tag:
+            self.chunks.append('/>')
+            self.open_tag = False
+        else:
+            self.chunks.append('</' + name + '>')
+
+        if len(self.chunks) > self.BUFFER_SIZE:
+            self.flush()
+
+
 class NUPN:
     """ NUPN.
     """
@@ -333,9 +535,24 @@ class NUPN:
             units.pop().places.append(place)
             return
 
-        optimal_unit = max(units, key=lambda unit: sum([len(subunit.places) for subunit in unit.descendants]))
+        # Ties are broken by id, for a deterministic projection
+        optimal_unit = max(units, key=lambda unit: (sum([len(subunit.places) for subunit in unit.descendants]), unit.id))
         optimal_unit.places.append(place)
 
+    def restriction(self, places):
+        """ Return a copy of the NUPN restricted to a set of places.
+        """
+        nupn = NUPN(self.unit_safe)
+
+        for unit in self.units.values():
+            new_unit = nupn.get_unit(unit.id)
+            new_unit.places = [place for place in unit.places if place in places]
+            new_unit.subunits = {nupn.get_unit(subunit.id) for subunit in unit.subunits}
+
+        nupn.root = nupn.get_unit(self.root.id)
+
+        return nupn
+
     def simplification(self):
         """ Simplify the units.
             - Merge units that contains only one subunit.
@@ -454,7 +671,8 @@ class Unit:
     def dfs_order(self, places_counter, units_counter, places_order, units_order):
         """ Set DFS order for units (and so places).
         """
-        for subunit in sorted(self.subunits, key=lambda unit: unit.max_depth, reverse=True):
+        # Deepest subunits first (ties broken by id, for a deterministic export)
+        for subunit in sorted(self.subunits, key=lambda unit: (-unit.max_depth, unit.id)):
             places_counter, units_counter = subunit.dfs_order(places_counter, units_counter, places_order, units_order)
 
         units_order.append(self)
@@ -0,0 +1,452 @@
+"""
+Server Module
+
+Long-running Kong daemon answering `conc`, `dead` and `reach` requests
+encoded as JSON lines over a Unix domain socket.
+
+The loaded nets, Token Flow Graphs and reduced results are kept in memory,
+with a least recently used eviction policy bounded by their memory footprint.
+
+This file is part of Kong.
+
+Kong is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Kong is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Kong. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Nicolas AMAT, LAAS-CNRS"
+__contact__ = "namat@laas.fr"
+__license__ = "GPLv3"
+__version__ = "2.0.0"
+
+import argparse
+import gc
+import io
+import json
+import logging as log
+import os
+import socket
+import socketserver
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from types import FunctionType, ModuleType
+
+from cache import Cache
+from kong import caesar_bdd, caesar_bdd_components, projection_formula, read_and_reduce, run_until_complete, sift_all
+from pt import PetriNet
+from tfg import TFG
+from utils import marking_parser, show_matrix
+
+# Options of the `conc` and `dead` requests with their default values
+CONC_DEAD_OPTIONS = {
+    'no_units': False,
+    'no_rle': False,
+    'place_names': False,
+    'no_split': False,
+    'command_reduced': 'caesar.bdd',
+    'bdd_timeout': None,
+    'bdd_iterations': None
+}
+
+# Objects not accounted in the memory footprint (shared by all the loaded nets)
+SHARED_OBJECTS = (type, ModuleType, FunctionType)
+
+
+def deep_size(obj):
+    """ Return the memory size of an object and of the objects it refers to (in bytes).
+        (classes, modules and functions are skipped)
+    """
+    size, visited, stack = 0, set(), [obj]
+
+    while stack:
+        obj = stack.pop()
+        if id(obj) in visited or isinstance(obj, SHARED_OBJECTS):
+            continue
+        visited.add(id(obj))
+        size += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+
+    return size
+
+
+class Model:
+    """
+    Loaded net.
+
+    Initial and reduced nets, Token Flow Graph,
+    and memoized results of the requests on the net.
+    """
+
+    def __init__(self, infile, shrink, no_units):
+        """ Initializer.
+            (the net is loaded by `load`)
+        """
+        self.infile, self.shrink, self.no_units = infile, shrink, no_units
+
+        # Lock serializing the load and the requests on the net (the Token Flow Graph is stateful)
+        self.lock = threading.Lock()
+
+        # Flags for the loaded net, and the net unloaded by the eviction
+        self.loaded, self.closed = False, False
+
+        # Memory footprints of the nets with the Token Flow Graph, and of the memoized results (in bytes)
+        self.size, self.results_size = 0, 0
+
+        self.directory = None
+
+    def load(self, cache_dir, cache_size):
+        """ Read and reduce the input net, then build the Token Flow Graph.
+        """
+        infile, shrink, no_units = self.infile, self.shrink, self.no_units
+
+        # Working directory (reduced net, NUPNs)
+        self.directory = tempfile.TemporaryDirectory()
+
+        # Convert .nupn to .pnml
+        self.nupn = None
+        if infile.lower().endswith('.nupn'):
+            self.nupn = infile
+            pnml = os.path.join(self.directory.name, 'initial.pnml')
+            with open(pnml, 'w') as fp:
+                subprocess.run(["caesar.bdd", "-pnml", infile], stdout=fp, check=True)
+        else:
+            assert infile.lower().endswith('.pnml'), "Unsupported input format"
+            pnml = infile
+
+        # Read initial Petri net while reducing it
+        self.reduced_net_filename = os.path.join(self.directory.name, 'reduced.net')
+        args = argparse.Namespace(infile=infile, shrink=shrink, cache_dir=cache_dir, cache_size=cache_size)
+        self.initial_net, _, _ = run_until_complete(read_and_reduce(args, pnml, self.reduced_net_filename, no_units))
+        if self.initial_net.f_file is not None:
+            self.initial_net.f_file.close()
+
+        # Read reduced net
+        self.reduced_net = PetriNet(self.reduced_net_filename)
+
+        # Build the Token Flow Graph
+        self.tfg = TFG(self.reduced_net_filename, self.initial_net, self.reduced_net)
+
+        self.reducible = self.reduced_net.number_places != self.initial_net.number_places or self.nupn is None
+
+        # Project units and convert reduced net to .nupn format
+        self.reduced_nupn = os.path.join(self.directory.name, 'reduced.nupn')
+        if self.reduced_net.places and self.reducible:
+            if not no_units and self.initial_net.nupn:
+                self.tfg.units_projection()
+            self.reduced_net.export_nupn(self.reduced_nupn)
+
+        # Memoized reduced results and outputs
+        self.reduced_results = {}
+        self.outputs = {}
+
+        self.measure()
+        self.loaded = True
+
+    def measure(self):
+        """ Measure the memory footprint of the nets and the Token Flow Graph.
+            (the state of the Token Flow Graph grows with the computations)
+        """
+        self.size = deep_size((self.initial_net, self.reduced_net, self.tfg))
+
+    def memoize(self, results, key, value):
+        """ Memoize a reduced result or an output, and account for its memory footprint.
+        """
+        results[key] = value
+        self.results_size += deep_size(key) + deep_size(value)
+
+    def footprint(self):
+        """ Return an estimate of the memory footprint (in bytes).
+        """
+        return self.size + self.results_size
+
+    def close(self):
+        """ Remove the working directory.
+        """
+        self.closed = True
+        if self.directory is not None:
+            self.directory.cleanup()
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Kong daemon.
+
+    Requests on a same net are handled one at a time (the Token Flow Graphs are stateful),
+    connections can send several requests.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, max_memory, cache_dir=None, cache_size=1024):
+        """ Initializer.
+        """
+        # Remove a stale socket, but neither another file nor the socket of a running daemon
+        if os.path.exists(socket_path):
+            if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+                raise FileExistsError("`{}' exists and is not a socket".format(socket_path))
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                try:
+                    probe.connect(socket_path)
+                except ConnectionRefusedError:
+                    os.remove(socket_path)
+                else:
+                    raise FileExistsError("Another daemon listens on `{}'".format(socket_path))
+
+        super().__init__(socket_path, RequestHandler)
+
+        # Maximal memory footprint of the loaded nets (in bytes)
+        self.max_memory = max_memory
+
+        # On-disk cache options (reduced nets and caesar.bdd results)
+        self.cache_dir, self.cache_size = cache_dir, cache_size
+
+        # Loaded nets, by order of last use
+        self.models = OrderedDict()
+
+        # Lock of the loaded nets (lookup, insertion and eviction)
+        self.lock = threading.Lock()
+
+        # Flag for a `shutdown` request (the daemon stops once the response is sent)
+        self.stopping = False
+
+    def server_close(self):
+        """ Close the socket and unload the nets.
+        """
+        super().server_close()
+
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+        with self.lock:
+            for model in self.models.values():
+                model.close()
+            self.models.clear()
+
+    @contextmanager
+    def model(self, infile, shrink=False, no_units=False):
+        """ Context holding the lock of the loaded net corresponding to an input file,
+            loading it if needed.
+            (a modified input file is loaded again)
+        """
+        infile_stat = os.stat(infile)
+        key = (os.path.realpath(infile), infile_stat.st_mtime_ns, infile_stat.st_size, shrink, no_units)
+
+        while True:
+            with self.lock:
+                model = self.models.get(key)
+                if model is not None:
+                    self.models.move_to_end(key)
+                else:
+                    model = Model(infile, shrink, no_units)
+                    self.models[key] = model
+
+            with model.lock:
+                # Case: unloaded by the eviction in the meantime
+                if model.closed:
+                    continue
+
+                if not model.loaded:
+                    log.info("> Load '%s'", infile)
+                    try:
+                        model.load(self.cache_dir, self.cache_size)
+                    except BaseException:
+                        with self.lock:
+                            if self.models.get(key) is model:
+                                del self.models[key]
+                        model.close()
+                        raise
+
+                yield model
+                return
+
+    def eviction(self):
+        """ Unload the least recently used nets
+            until the total footprint is within the bound.
+            (the most recently used net and the nets in use are always kept)
+        """
+        with self.lock:
+            total = sum(model.footprint() for model in self.models.values())
+
+            for key in list(self.models)[:-1]:
+                if total <= self.max_memory:
+                    break
+
+                model = self.models[key]
+                if not model.lock.acquire(blocking=False):
+                    continue
+
+                try:
+                    log.info("> Unload '%s'", key[0])
+                    del self.models[key]
+                    total -= model.footprint()
+                    model.close()
+                finally:
+                    model.lock.release()
+
+    def handle_request_line(self, line):
+        """ Answer a JSON request, returns a JSON-serializable response.
+        """
+        try:
+            request = json.loads(line)
+            command = request.get('command')
+
+            if command in ('conc', 'dead'):
+                response = {'result': self.conc_dead(request, command)}
+            elif command == 'reach':
+                response = {'verdicts': self.reach(request)}
+            elif command == 'stats':
+                with self.lock:
+                    response = {'nets': [key[0] for key in self.models], 'memory': sum(model.footprint() for model in self.models.values())}
+            elif command == 'shutdown':
+                self.stopping = True
+                response = {'result': 'shutdown'}
+            else:
+                raise ValueError("Unknown command `{}'".format(command))
+
+            self.eviction()
+
+        except Exception as error:
+            log.warning("> Request failed: %s", error)
+            response = {'error': "{}: {}".format(type(error).__name__, error)}
+
+        return response
+
+    def conc_dead(self, request, command):
+        """ Compute the concurrency matrix or the dead places vector.
+        """
+        options = {option: request.get(option, default) for option, default in CONC_DEAD_OPTIONS.items()}
+        with self.model(request['infile'], request.get('shrink', False), options['no_units']) as model:
+            # Memoized output
+            output_key = (command,) + tuple(options.values())
+            if output_key in model.outputs:
+                return model.outputs[output_key]
+
+            caesar_option = "-concurrent-places" if command == 'conc' else "-dead-places"
+            vector = command == 'dead'
+
+            # Environment of caesar.bdd with the limits of the request
+            env = dict(os.environ)
+            for variable, option in (('CAESAR_BDD_TIMEOUT', 'bdd_timeout'), ('CAESAR_BDD_ITERATIONS', 'bdd_iterations')):
+                if options[option]:
+                    env[variable] = str(options[option])
+
+            if not model.reduced_net.places:
+                # Fully reducible net case
+                reduced_matrix, complete_matrix = '', True
+            else:
+                reduced_key = (command, options['no_split'], options['command_reduced'], env.get('CAESAR_BDD_TIMEOUT'), env.get('CAESAR_BDD_ITERATIONS'))
+                if reduced_key not in model.reduced_results:
+                    cache = Cache(self.cache_dir, self.cache_size * 2 ** 20) if self.cache_dir else None
+                    if model.reducible:
+                        components = [model.reduced_net.places] if options['no_split'] else model.reduced_net.connected_components()
+                        if len(components) > 1:
+                            model.memoize(model.reduced_results, reduced_key, caesar_bdd_components(options['command_reduced'], caesar_option, model.reduced_net, components, vector, cache, env=env))
+                        else:
+                            reduced_matrix, complete_matrix = caesar_bdd(options['command_reduced'], caesar_option, model.reduced_nupn, cache, env=env)
+                            model.memoize(model.reduced_results, reduced_key, (reduced_matrix[0] if vector else reduced_matrix, complete_matrix))
+                    else:
+                        # Irreducible .nupn: the result of the original net is the output
+                        reduced_matrix, complete_matrix = caesar_bdd(options['command_reduced'], caesar_option, model.nupn, cache, env=env)
+                        model.memoize(model.reduced_results, reduced_key, (reduced_matrix[0] if vector else reduced_matrix, complete_matrix))
+                reduced_matrix, complete_matrix = model.reduced_results[reduced_key]
+
+            # Change of dimension (the state of the Token Flow Graph is reset)
+            if model.reducible:
+                model.tfg.init_state()
+                if vector:
+                    result = model.tfg.dead_places_vector(reduced_matrix, complete_matrix)
+                else:
+                    result = model.tfg.concurrency_matrix(reduced_matrix, complete_matrix)
+                model.measure()
+            else:
+                result = reduced_matrix
+
+            output = io.StringIO()
+            show_matrix(result, model.initial_net, options['no_rle'], options['place_names'], output)
+            model.memoize(model.outputs, output_key, output.getvalue())
+
+            return model.outputs[output_key]
+
+    def reach(self, request):
+        """ Decide the reachability of markings.
+            (`marking`: one marking, `markings`: dictionary of named markings)
+        """
+        with self.model(request['infile'], request.get('shrink', False)) as model:
+            if 'markings' in request:
+                markings = request['markings']
+            else:
+                markings = {None: request['marking']}
+
+            verdicts, formulas = {}, {}
+            for name, marking in markings.items():
+                reduced_marking = model.tfg.marking_projection(marking_parser(marking))
+
+                if reduced_marking is None:
+                    # Case: no possible projection
+                    verdicts[name] = False
+                elif not reduced_marking:
+                    # Case: tautological projection
+                    verdicts[name] = True
+                else:
+                    # Case: projection to check
+                    verdicts[name] = formula = projection_formula(reduced_marking)
+                    if ('reach', formula) not in model.outputs:
+                        formulas[formula] = None
+
+            # Query to sift the formulas not checked yet (memoized)
+            if formulas:
+                for formula, verdict in zip(formulas, run_until_complete(sift_all(model.reduced_net_filename, list(formulas), os.cpu_count() or 1))):
+                    model.memoize(model.outputs, ('reach', formula), verdict)
+
+            for name, verdict in verdicts.items():
+                if isinstance(verdict, str):
+                    verdicts[name] = model.outputs[('reach', verdict)]
+
+            if 'markings' in request:
+                return verdicts
+            else:
+                return verdicts[None]
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Connection handler.
+
+    One JSON response line per JSON request line.
+    """
+
+    def handle(self):
+        """ Answer the requests of the connection.
+        """
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            response = self.server.handle_request_line(line.decode('utf-8'))
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+            if self.server.stopping:
+                threading.Thread(target=self.server.shutdown).start()
+                return
+
+
+def serve(socket_path, max_memory, cache_dir=None, cache_size=1024):
+    """ Run the daemon until a `shutdown` request.
+    """
+    with Server(socket_path, max_memory, cache_dir, cache_size) as server:
+        log.info("> Listen on '%s'", socket_path)
+        server.serve_forever()
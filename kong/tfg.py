@@ -23,18 +23,50 @@ __license__ = "GPLv3"
 __version__ = "2.0.0"
 
 import itertools
-import re
-from collections import deque
+import mmap
+import struct
+from array import array
+from collections import defaultdict, deque
+
+from matrix import TriangularMatrix
+from pt import PetriNet
 
 try:
     from graphviz import Graph
 except ImportError:
     Graph = None
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Braces surrounding identifiers in equations
+BRACES = str.maketrans('', '', '{}')
+
+# Decoding of the rows of concurrency queries
+ROW_DECODING = bytes.maketrans(b'\x00\x01', b'01')
+
+# Snapshot format: magic number, header (number of nodes, number of places of the initial net, dead root,
+# counter of non-dead roots, size of the ids, and size of each integer array)
+SNAPSHOT_MAGIC = b'KONGTFG\x01'
+SNAPSHOT_HEADER = struct.Struct('=13q')
+SNAPSHOT_ITEM_SIZE = 8
+
 
 class TFG:
     """
     Token Flow Graph.
+
+    Nodes are identified by an index:
+    - the nodes of the places of the initial net come first,
+      with the same index as in the initial net,
+    - followed by the additional variables.
+
+    Arcs are stored in compressed sparse row arrays:
+    - the children of node `i` are `children[child_offsets[i]:child_offsets[i + 1]]`,
+      agglomerated nodes first, and redundant nodes from `redundant_offsets[i]`,
+    - the parents of node `i` are `parents[parent_offsets[i]:parent_offsets[i + 1]]`.
     """
 
     def __init__(self, filename, initial_net, reduced_net, show_equations=False):
@@ -44,8 +76,18 @@ class TFG:
         self.initial_net = initial_net
         self.reduced_net = reduced_net
 
+        # Node ids and index of each id
+        self.ids = []
+        self.indices = {}
+
+        # Interval flags
+        self.intervals = bytearray()
+
+        # Arcs `(parent, child)` in parsing order (flattened), until the adjacency arrays are built
+        self.agglomeration_arcs = array('l')
+        self.redundancy_arcs = array('l')
+
         # Nodes initialization
-        self.nodes = {}
         self.init_nodes()
 
         # Non-dead roots
@@ -57,6 +99,91 @@ class TFG:
 
         # Parse the system of equations and build the Token Flow Graph
         self.parse_system(filename, show_equations)
+        self.build_adjacency()
+
+        # Nodes sorted such that parents precede their children
+        self.topological_order = self.topological_sort()
+
+        # Computation state
+        self.init_state()
+
+    @classmethod
+    def load(cls, filename):
+        """ Load a Token Flow Graph from a snapshot (memory-mapped).
+            The Petri nets only contain their places.
+        """
+        with open(filename, 'rb') as fp:
+            data = memoryview(mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ))
+
+        if data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise ValueError("Invalid Token Flow Graph snapshot")
+        offset = len(SNAPSHOT_MAGIC)
+
+        header = SNAPSHOT_HEADER.unpack_from(data, offset)
+        offset += SNAPSHOT_HEADER.size
+        number_nodes, number_initial_places, dead_root, counter_non_dead_roots, ids_size = header[:5]
+
+        # Integer arrays (views on the mapped file)
+        arrays = []
+        for size in header[5:]:
+            arrays.append(data[offset:offset + SNAPSHOT_ITEM_SIZE * size].cast('q'))
+            offset += SNAPSHOT_ITEM_SIZE * size
+        tfg = cls.__new__(cls)
+        tfg.child_offsets, tfg.redundant_offsets, tfg.children, tfg.parent_offsets, tfg.parents, tfg.topological_order, non_dead_roots, reduced_places = arrays
+
+        # Interval flags and node ids
+        tfg.intervals = data[offset:offset + number_nodes]
+        offset += number_nodes
+        tfg.ids = str(data[offset:offset + ids_size], 'utf-8').split('\n')
+        tfg.indices = {id_node: index for index, id_node in enumerate(tfg.ids)}
+
+        tfg.dead_root, tfg.counter_non_dead_roots, tfg.non_dead_roots = dead_root, counter_non_dead_roots, non_dead_roots.tolist()
+
+        # Petri nets
+        tfg.initial_net, tfg.reduced_net = PetriNet(None, initial_net=True), PetriNet(None)
+        tfg.initial_net.places = tfg.ids[:number_initial_places]
+        tfg.reduced_net.places = [tfg.ids[index] for index in reduced_places]
+        for net in (tfg.initial_net, tfg.reduced_net):
+            net.number_places = len(net.places)
+
+        tfg.init_state()
+
+        return tfg
+
+    def save(self, filename):
+        """ Save a snapshot of the Token Flow Graph.
+            Format: magic number, header, arrays of 64-bit integers (native byte order), interval flags and node ids.
+        """
+        arrays = [array('q', values) for values in (self.child_offsets, self.redundant_offsets, self.children, self.parent_offsets, self.parents, self.topological_order, self.non_dead_roots, [self.indices[place] for place in self.reduced_net.places])]
+        ids = '\n'.join(self.ids).encode('utf-8')
+
+        with open(filename, 'wb') as fp:
+            fp.write(SNAPSHOT_MAGIC)
+            fp.write(SNAPSHOT_HEADER.pack(len(self.ids), self.initial_net.number_places, self.dead_root, self.counter_non_dead_roots, len(ids), *map(len, arrays)))
+            for values in arrays:
+                fp.write(values.tobytes())
+            fp.write(bytes(self.intervals))
+            fp.write(ids)
+
+    def init_state(self):
+        """ Initialize the state of the computations.
+        """
+        # Propagation and dead flags
+        self.propagated = bytearray(len(self.ids))
+        self.dead = bytearray(len(self.ids))
+
+        # Independent nodes sets
+        self.independent = defaultdict(set)
+
+        # Memoized successors of the roots (indices of the places in the initial net)
+        self.successors = {}
+
+        # Roots of the reduced places (index in the reduced net), and set of the non-dead roots (computed once)
+        self.reduced_roots, self.non_dead_roots_set = None, None
+
+        # Bottom-up order and redundancy checks of the marking projection (computed once)
+        self.bottom_up_order = None
+        self.check_offsets, self.checks, self.check_intervals = None, None, None
 
     def draw_graph(self):
         """ Draw the Token Flow Graph.
@@ -65,20 +192,22 @@ class TFG:
 
         tfg = Graph('TFG')
 
+        nodes = [self.node(index) for index in range(len(self.ids))]
+
         # Draw nodes
         tfg.attr('node', shape='circle', fixedsize='True')
-        for node in self.nodes.values():
+        for node in nodes:
             tfg.node(node.id)
 
         # Draw redundant arcs
         tfg.attr('edge', arrowhead='dotnormal', arrowtail='none')
-        for node in self.nodes.values():
+        for node in nodes:
             for redundant in node.redundant:
                 tfg.edge(node.id, redundant.id, dir='both')
 
         # Draw agglomerated arcs
         tfg.attr('edge', arrowhead='normal', arrowtail='odot')
-        for node in self.nodes.values():
+        for node in nodes:
             for agglomerated in node.agglomerated:
                 tfg.edge(node.id, agglomerated.id, dir='both')
 
@@ -88,44 +217,76 @@ class TFG:
         """ Create a node for each place from the initial net.
         """
         for place in self.initial_net.places:
-            new_node = Node(place)
-            self.nodes[place] = new_node
+            self.add_node(place)
+
+    def add_node(self, id_node):
+        """ Create a new node and return its index.
+        """
+        index = len(self.ids)
+        self.ids.append(id_node)
+        self.indices[id_node] = index
+        self.intervals.append(0)
+        return index
 
     def get_node(self, id_node):
-        """ Return the node that corresponds to the id if it exists,
-            otherwise create a new one and return it.
+        """ Return the index of the node that corresponds to the id if it exists,
+            otherwise create a new one and return its index.
         """
         if id_node.isdigit() and id_node != '0':
             self.counter_non_dead_roots += 1
-            id_node = "{}#{}".format(id_node, self.counter_non_dead_roots)
-            node = Node(id_node, additional=True)
-            self.nodes[id_node] = node
+            node = self.add_node("{}#{}".format(id_node, self.counter_non_dead_roots))
             self.non_dead_roots.append(node)
             return node
 
-        if id_node in self.nodes:
-            return self.nodes[id_node]
+        if id_node in self.indices:
+            return self.indices[id_node]
         else:
-            node = Node(id_node, additional=True)
-            self.nodes[id_node] = node
-            return node
+            return self.add_node(id_node)
+
+    def node(self, index):
+        """ Return a view on a node.
+        """
+        return Node(self, index)
+
+    def is_additional(self, node):
+        """ Return `True` if the node is an additional variable (not in the initial net).
+        """
+        return node >= self.initial_net.number_places
 
     def parse_system(self, filename, show_equations):
         """ System of equations parser.
             Input format: .net (output of the `reduce` tool)
+            (the file is read line by line, up to the end of the `# generated equations` block)
         """
         try:
             with open(filename, 'r') as fp:
-                content = re.search(r'# generated equations\n(.*)?\n\n', fp.read(), re.DOTALL)
-                if content:
+                # Skip the lines before the equations
+                for line in fp:
+                    if line.startswith("# generated equations"):
+                        break
+                else:
+                    return
+
+                if show_equations:
+                    print("# System of equations")
+
+                for line in fp:
+                    line = line.rstrip('\n')
+
+                    # Skip empty lines
+                    if not line:
+                        continue
+
+                    # End of the equations
+                    if not line.startswith('#'):
+                        break
+
                     if show_equations:
-                        print("# System of equations")
-                    for line in re.split('\n+', content.group())[1:-1]:
-                        if show_equations:
-                            if not '# net' in line:
-                                print(line)
-                        inequation_flag = '<=' in line
-                        self.parse_equation(re.split(r'\s+', line.replace(' |- ', ' ').replace('# ', '').replace(' <= ', ' ').replace(' = ', ' ').replace(' + ', ' ').replace('{', '').replace('}', '')), inequation_flag)
+                        if not '# net' in line:
+                            print(line)
+
+                    # Tokens alternate between operators and operands: `# kind |- node = node + ... + node`
+                    self.parse_equation(line.translate(BRACES).split()[1::2], '<=' in line)
 
         except FileNotFoundError as e:
             exit(e)
@@ -135,34 +296,106 @@ class TFG:
             Input format: .net (output of the `reduced` tool)
         """
         # Split equation
-        kind = equation.pop(0)
+        kind = equation[0]
 
         # Skip comment on the bound
         if kind == 'net':
             return
 
-        nodes = [self.get_node(id_node) for id_node in equation]
+        nodes = [self.get_node(id_node) for id_node in equation[1:]]
 
         # Redundance (Constant or Duplication or Shortcut)
         if kind in ['R', 'I']:
             child = nodes.pop(0)
             for parent in nodes:
-                parent.redundant.append(child)
+                self.redundancy_arcs.extend((parent, child))
                 if inequation_flag:
-                    parent.interval = True
-                child.parents.append(parent)
+                    self.intervals[parent] = True
             return
 
         # Agglomeration
         if kind == 'A':
             parent = nodes.pop(0)
             for child in nodes:
-                parent.agglomerated.append(child)
-                child.parents.append(parent)
+                self.agglomeration_arcs.extend((parent, child))
             return
 
         raise ValueError("Invalid reduction equation")
 
+    def build_adjacency(self):
+        """ Build the adjacency arrays from the parsed arcs.
+            (the order of the children of a node is kept)
+        """
+        number_nodes = len(self.ids)
+        agglomeration_arcs, redundancy_arcs = self.agglomeration_arcs, self.redundancy_arcs
+
+        # Count the children (agglomerated and redundant) and the parents of each node
+        number_agglomerated, number_redundant, number_parents = array('l', [0]) * number_nodes, array('l', [0]) * number_nodes, array('l', [0]) * number_nodes
+        for parent in agglomeration_arcs[0::2]:
+            number_agglomerated[parent] += 1
+        for parent in redundancy_arcs[0::2]:
+            number_redundant[parent] += 1
+        for child in itertools.chain(agglomeration_arcs[1::2], redundancy_arcs[1::2]):
+            number_parents[child] += 1
+
+        # Offsets
+        self.child_offsets = array('l', itertools.accumulate(itertools.chain((0,), map(sum, zip(number_agglomerated, number_redundant)))))
+        self.redundant_offsets = array('l', map(sum, zip(self.child_offsets, number_agglomerated)))
+        self.parent_offsets = array('l', itertools.accumulate(itertools.chain((0,), number_parents)))
+
+        # Fill children
+        self.children = array('l', [0]) * ((len(agglomeration_arcs) + len(redundancy_arcs)) // 2)
+        for arcs, positions in ((agglomeration_arcs, self.child_offsets[:-1]), (redundancy_arcs, self.redundant_offsets[:])):
+            for parent, child in zip(arcs[0::2], arcs[1::2]):
+                self.children[positions[parent]] = child
+                positions[parent] += 1
+
+        # Fill parents
+        self.parents = array('l', [0]) * len(self.children)
+        positions = self.parent_offsets[:-1]
+        for arcs in (agglomeration_arcs, redundancy_arcs):
+            for parent, child in zip(arcs[0::2], arcs[1::2]):
+                self.parents[positions[child]] = parent
+                positions[child] += 1
+
+        # Free the parsed arcs
+        self.agglomeration_arcs, self.redundancy_arcs = None, None
+
+    def get_children(self, node):
+        """ Return the agglomerated then redundant children of a node.
+        """
+        return self.children[self.child_offsets[node]:self.child_offsets[node + 1]]
+
+    def get_agglomerated(self, node):
+        """ Return the agglomerated children of a node.
+        """
+        return self.children[self.child_offsets[node]:self.redundant_offsets[node]]
+
+    def get_redundant(self, node):
+        """ Return the redundant children of a node.
+        """
+        return self.children[self.redundant_offsets[node]:self.child_offsets[node + 1]]
+
+    def get_parents(self, node):
+        """ Return the parents of a node.
+        """
+        return self.parents[self.parent_offsets[node]:self.parent_offsets[node + 1]]
+
+    def topological_sort(self):
+        """ Return the nodes such that parents precede their children.
+        """
+        # Number of parents not yet sorted
+        remaining_parents = array('l', (end - start for start, end in zip(self.parent_offsets, self.parent_offsets[1:])))
+
+        order = array('l', (node for node, number_parents in enumerate(remaining_parents) if not number_parents))
+        for node in order:
+            for child in self.get_children(node):
+                remaining_parents[child] -= 1
+                if not remaining_parents[child]:
+                    order.append(child)
+
+        return order
+
     def units_projection(self):
         """ Project the units.
         """
@@ -171,10 +404,10 @@ class TFG:
 
         # Iterate over the places of the reduced net
         for place in self.reduced_net.places:
- 
+
             # Find leaves
             leaves = set()
-            self.explore_leaves(self.nodes[place], leaves)
+            self.explore_leaves(self.indices[place], leaves)
 
             # Compute optimal units
             units = set()
@@ -191,82 +424,110 @@ class TFG:
         for place in sorted(self.reduced_net.places, key=lambda pl: len(minimal_units[pl])):
             self.reduced_net.nupn.add_place(place, minimal_units[place])
 
-    def explore_leaves(self, node, leaves=set()):
+    def explore_leaves(self, node, leaves):
         """ Update the set of nodes that are not additional.
         """
-        if not node.additional:
-            leaves.add(node.id)
+        # Nodes to explore
+        stack, visited = [node], {node}
+
+        while stack:
+            node = stack.pop()
 
-        for succ in node.agglomerated + node.redundant:
-            self.explore_leaves(succ, leaves)
+            if not self.is_additional(node):
+                leaves.add(self.ids[node])
 
-    def token_propagation(self, node, value, matrix, complete_matrix, memoize=False):
+            for succ in self.get_children(node):
+                if succ not in visited:
+                    visited.add(succ)
+                    stack.append(succ)
+
+    def token_propagation(self, root, value, matrix, complete_matrix, memoize=False):
         """ Token propagation:
             - propagate non dead/dead places,
             - learn new concurrent/independent places,
             - memoize successors.
         """
-        # Initialization
-        successors = []
+        children, child_offsets, redundant_offsets = self.children, self.child_offsets, self.redundant_offsets
+        propagated, dead, independent = self.propagated, self.dead, self.independent
 
-        # Case: partial relation and parents already propagated
-        if not complete_matrix and all(parent.propagated for parent in node.parents):
+        # Stack of the nodes being propagated: node, propagated value, successors, position of the next child
+        stack = []
 
-            # Update `propagated` flag of the node
-            node.propagated = True
+        node = root
+        while True:
 
-            # Set redundant nodes as independent
-            for red_1, red_2 in itertools.combinations(node.parents, 2):
-                red_1.independent.add(red_2)
-                red_2.independent.add(red_1)
+            # Visit a new node
+            if node is not None:
 
-            # Set the predecessors of the node
-            node.predecessors = [predecessor for parent in node.parents for predecessor in parent.predecessors]
+                # Initialization
+                successors = []
 
-        # Case: partial relation
-        if not complete_matrix:
+                # Case: partial relation
+                if not complete_matrix:
+                    parents = self.get_parents(node)
 
-            # Update `dead` flag
-            if value == '0':
-                # If all parents are dead set the node to dead, otherwise cannot propagate a dead value anymore
-                if all(parent.dead for parent in node.parents):
-                    node.dead = True
-                else:
-                    value = '.'
-
-        # Case: the node is a place from the initial net
-        if not node.additional:
-            
-            # Set its value (if different from '.') in the concurrency matrix (non-dead / dead)
-            if value != '.':
-                order = self.initial_net.order[node.id]
-                matrix[order][order] = value
-
-            # Add the node to the successors and predecessors lists
-            successors.append(node)
-            node.predecessors.append(node)
-
-        # Set agglomerated nodes as independent
-        for agg_1, agg_2 in itertools.combinations(node.agglomerated, 2):
-            agg_1.independent.add(agg_2)
-            agg_2.independent.add(agg_1)
-
-        # Token propagation over the agglomerated nodes
-        for agglomerated in node.agglomerated:
-            agg_successors = self.token_propagation(agglomerated, value, matrix, complete_matrix)
-            successors += agg_successors
-            
-        # Token propagation over the redundancy nodes
-        for redundant in node.redundant:
-            red_successors = self.token_propagation(redundant, value, matrix, complete_matrix)
-            # Learn new concurrent places
-            if value == '1':
-                self.product(red_successors, successors, value, matrix)
-            successors += red_successors
+                    # Case: parents already propagated
+                    if all(propagated[parent] for parent in parents):
+
+                        # Update `propagated` flag of the node
+                        propagated[node] = True
+
+                        # Set redundant nodes as independent
+                        for red_1, red_2 in itertools.combinations(parents, 2):
+                            independent[red_1].add(red_2)
+                            independent[red_2].add(red_1)
+
+                    # Update `dead` flag
+                    if value == '0':
+                        # If all parents are dead set the node to dead, otherwise cannot propagate a dead value anymore
+                        if all(dead[parent] for parent in parents):
+                            dead[node] = True
+                        else:
+                            value = '.'
+
+                    # Set agglomerated nodes as independent
+                    for agg_1, agg_2 in itertools.combinations(children[child_offsets[node]:redundant_offsets[node]], 2):
+                        independent[agg_1].add(agg_2)
+                        independent[agg_2].add(agg_1)
+
+                # Case: the node is a place from the initial net
+                if not self.is_additional(node):
+
+                    # Set its value (if different from '.') in the concurrency matrix (non-dead / dead)
+                    if value != '.':
+                        matrix.set(node, node, value)
+
+                    # Add the node to the successors
+                    successors.append(node)
+
+                stack.append([node, value, successors, child_offsets[node]])
+
+            frame = stack[-1]
+            node, value, successors, position = frame
+
+            # Token propagation over the agglomerated nodes, then the redundancy nodes
+            if position < child_offsets[node + 1]:
+                frame[3] += 1
+                node = children[position]
+                continue
+
+            # All the children have been propagated
+            stack.pop()
+            if not stack:
+                break
+
+            # Add the successors of the node to its parent
+            parent, parent_value, parent_successors, parent_position = stack[-1]
+            if parent_position > redundant_offsets[parent] and parent_value == '1':
+                # Learn new concurrent places
+                self.product(successors, parent_successors, parent_value, matrix)
+            parent_successors += successors
+
+            node = None
 
         # Successors memoization
         if memoize:
-            node.successors = successors
+            self.successors[root] = array('l', sorted(set(successors)))
 
         # Return successors
         return successors
@@ -279,11 +540,13 @@ class TFG:
             relation = '0'
         else:
             relation = '.'
-        matrix = [[relation for _ in range(i + 1)] for i in range(self.initial_net.number_places)]
+        matrix = TriangularMatrix(self.initial_net.number_places, relation)
 
         # Propagate non-dead roots
+        non_dead_successors = set()
         for non_dead_root in self.non_dead_roots:
             self.token_propagation(non_dead_root, '1', matrix, complete_matrix, memoize=True)
+            non_dead_successors.update(self.successors[non_dead_root])
 
         # Case: partial relation
         if not complete_matrix:
@@ -294,23 +557,24 @@ class TFG:
         for i in range(self.reduced_net.number_places):
 
             # Get corresponding root and matrix value
-            root = self.get_node(self.reduced_net.places[i])
+            root = self.indices[self.reduced_net.places[i]]
             value = reduced_matrix[i][i]
 
             # Alive root
             if value == '1':
                 self.token_propagation(root, value, matrix, complete_matrix, memoize=True)
                 # Product with non-dead roots
-                for non_dead_root in self.non_dead_roots:
-                    self.product(non_dead_root.successors, root.successors, value, matrix)
+                self.product(non_dead_successors, self.successors[root], value, matrix)
 
             # Case: partial relation and root not already propagated
             if not complete_matrix and value != '1':
                 self.token_propagation(root, value, matrix, complete_matrix, memoize=True)
 
         # Product with non-dead roots
-        for non_dead_root_1, non_dead_root_2 in itertools.combinations(self.non_dead_roots, 2):
-            self.product(non_dead_root_1.successors, non_dead_root_2.successors, '1', matrix)
+        previous_successors = set()
+        for non_dead_root in self.non_dead_roots:
+            self.product(self.successors[non_dead_root], previous_successors, '1', matrix)
+            previous_successors.update(self.successors[non_dead_root])
 
         # Propagate the concurrency relation from the reduced matrix
         for i, line in enumerate(reduced_matrix):
@@ -318,21 +582,29 @@ class TFG:
             # Skip dead roots
             if line[i] == '0':
                 continue
-            
+
+            root_1 = self.indices[self.reduced_net.places[i]]
+
+            # Successors of the roots concurrent to the current one
+            concurrent_successors = set()
+
             # Only iterate over the lower triangle (symmetric relation)
             for j, concurrency in enumerate(line[:-1]):
 
                 # The product of the concurrent roots' successors is included in the concurrency relation
                 if concurrency == '1':
-                    root_1, root_2 = self.get_node(self.reduced_net.places[i]), self.get_node(self.reduced_net.places[j])
-                    self.product(root_1.successors, root_2.successors, '1', matrix)
+                    root_2 = self.indices[self.reduced_net.places[j]]
+                    concurrent_successors.update(self.successors.get(root_2, ()))
 
                 # Case: partial relation
                 if not complete_matrix and concurrency == '0':
                     # Set roots as independent
-                    root_1, root_2 = self.get_node(self.reduced_net.places[i]), self.get_node(self.reduced_net.places[j])
-                    root_1.independent.add(root_2)
-                    root_2.independent.add(root_1)
+                    root_2 = self.indices[self.reduced_net.places[j]]
+                    self.independent[root_1].add(root_2)
+                    self.independent[root_2].add(root_1)
+
+            # Set the products of the row at once
+            self.product(self.successors.get(root_1, ()), concurrent_successors, '1', matrix)
 
         # Case: partial relation
         if not complete_matrix:
@@ -346,101 +618,286 @@ class TFG:
 
             # Add places from reduced net
             for place_id in self.reduced_net.places:
-                queue.append(self.get_node(place_id))
+                queue.append(self.indices[place_id])
 
             while queue:
                 # Get first node in the queue
                 node = queue.popleft()
 
                 # Iterate over the intersection of the independent places from the non-dead parents parents
-                non_dead_parents = [parent.independent for parent in node.parents if not parent.dead]
+                non_dead_parents = [self.independent[parent] for parent in self.get_parents(node) if not self.dead[parent]]
                 if non_dead_parents:
-                    for independent_node in set.intersection(*non_dead_parents): 
+                    for independent_node in set.intersection(*non_dead_parents):
                         # Add the independency relation in nodes
-                        node.independent.add(independent_node)
-                        independent_node.independent.add(node)
+                        self.independent[node].add(independent_node)
+                        self.independent[independent_node].add(node)
 
                 # Add the independency relations in the matrix for places from the initial net
-                if not node.additional:
-                    self.product([node], [independent_node for independent_node in node.independent if not independent_node.additional], '0', matrix)
+                if not self.is_additional(node):
+                    self.product([node], [independent_node for independent_node in self.independent[node] if not self.is_additional(independent_node)], '0', matrix)
 
                 # Add children to the queue
-                for child in node.agglomerated + node.redundant:
-                    queue.append(child)
+                queue.extend(self.get_children(node))
 
         # Case: partial relation
         # Dead places are independent to all others places
-        dead_columns = []
-        for i, row in enumerate(matrix):
-            # If the place is dead set the row to `0` 
-            if row[i] == '0':
-                for j in range(len(row)):
-                    row[j] = '0'
-                # Add the place to the dead columns
-                dead_columns.append(i)
-            else:
-                # If the place is not dead, set the dead columns to `0`
-                for dead_column in dead_columns:
-                    row[dead_column] = '0'      
+        for i in range(len(matrix)):
+            # If the place is dead set its row and column to `0`
+            if matrix.get(i, i) == '0':
+                matrix.fill_row(i, '0')
+                matrix.fill_column(i, '0')
 
         return matrix
 
     def product(self, places1, places2, value, matrix):
-        """ Set the cartesian product between two lists of places
-            to a value in the initial matrix. 
+        """ Set the cartesian product between two collections of places
+            (given by their index in the initial net) to a value in the initial matrix.
+        """
+        matrix.set_product(places1, places2, value)
+
+    def ancestors(self, node):
+        """ Return the set of the ancestors of a node (including the node).
+        """
+        parents, parent_offsets = self.parents, self.parent_offsets
+
+        visited, stack = {node}, [node]
+        while stack:
+            node = stack.pop()
+            for parent in parents[parent_offsets[node]:parent_offsets[node + 1]]:
+                if parent not in visited:
+                    visited.add(parent)
+                    stack.append(parent)
+
+        return visited
+
+    def mark_successors(self, node, row, visited):
+        """ Set to `1` the places of the initial net that are successors of a node (including the node) in a row.
+            (the nodes in `visited` are skipped, and added to it)
+        """
+        children, child_offsets = self.children, self.child_offsets
+
+        if node in visited:
+            return
+        visited.add(node)
+
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if not self.is_additional(node):
+                row[node] = 1
+            for child in children[child_offsets[node]:child_offsets[node + 1]]:
+                if child not in visited:
+                    visited.add(child)
+                    stack.append(child)
+
+    def alive_roots(self, ancestors, reduced_matrix):
+        """ Return the roots among some nodes that are propagated with a `1` value
+            (non-dead roots and non-dead places of the reduced net).
+        """
+        if self.reduced_roots is None:
+            self.reduced_roots = {self.indices[place]: i for i, place in enumerate(self.reduced_net.places)}
+            self.non_dead_roots_set = set(self.non_dead_roots)
+
+        alive = []
+        for node in ancestors:
+            if node in self.non_dead_roots_set:
+                alive.append(node)
+            elif node in self.reduced_roots:
+                i = self.reduced_roots[node]
+                if reduced_matrix[i][i] == '1':
+                    alive.append(node)
+
+        return alive
+
+    def concurrent_roots(self, root_1, root_2, reduced_matrix):
+        """ Return `True` if the products of the successors of two distinct alive roots are in the concurrency relation.
+        """
+        if root_1 in self.non_dead_roots_set or root_2 in self.non_dead_roots_set:
+            return True
+
+        i, j = self.reduced_roots[root_1], self.reduced_roots[root_2]
+        return reduced_matrix[max(i, j)][min(i, j)] == '1'
+
+    def live_ancestors(self, ancestors, alive):
+        """ Return the ancestors successors of alive roots.
+        """
+        children, child_offsets = self.children, self.child_offsets
+
+        live, stack = set(alive), list(alive)
+        while stack:
+            node = stack.pop()
+            for child in children[child_offsets[node]:child_offsets[node + 1]]:
+                if child in ancestors and child not in live:
+                    live.add(child)
+                    stack.append(child)
+
+        return live
+
+    def concurrent_places(self, reduced_matrix, complete_matrix, place_1, place_2):
+        """ Return the value of a pair of places in the concurrency matrix.
+            (only the ancestors of the two places are explored if the reduced matrix is complete)
+        """
+        node_1, node_2 = self.indices[place_1], self.indices[place_2]
+
+        # Case: partial relation (whole change of dimension)
+        if not complete_matrix:
+            self.init_state()
+            return self.concurrency_matrix(reduced_matrix, complete_matrix).get(node_1, node_2)
+
+        ancestors_1, ancestors_2 = self.ancestors(node_1), self.ancestors(node_2)
+        alive_1, alive_2 = self.alive_roots(ancestors_1, reduced_matrix), self.alive_roots(ancestors_2, reduced_matrix)
+
+        # Dead places are independent to all others places
+        if not alive_1 or not alive_2:
+            return '0'
+        if node_1 == node_2:
+            return '1'
+
+        # Products of the successors of concurrent roots
+        for root_1 in alive_1:
+            for root_2 in alive_2:
+                if root_1 != root_2 and self.concurrent_roots(root_1, root_2, reduced_matrix):
+                    return '1'
+
+        # Products learned by the token propagation: redundant child with the node and its previous children
+        redundant_offsets, child_offsets = self.redundant_offsets, self.child_offsets
+        for node in self.live_ancestors(ancestors_1, alive_1) & ancestors_2:
+            previous_1, previous_2 = node == node_1, node == node_2
+            for position, child in enumerate(self.get_children(node), child_offsets[node]):
+                in_1, in_2 = child in ancestors_1, child in ancestors_2
+                if position >= redundant_offsets[node] and ((in_1 and previous_2) or (in_2 and previous_1)):
+                    return '1'
+                previous_1, previous_2 = previous_1 or in_1, previous_2 or in_2
+
+        return '0'
+
+    def concurrency_row(self, reduced_matrix, complete_matrix, place):
+        """ Return the row of a place in the concurrency matrix (over all the places).
+            (only the ancestors of the place and the successors of the concurrent roots are explored if the reduced matrix is complete)
+        """
+        node = self.indices[place]
+
+        # Case: partial relation (whole change of dimension)
+        if not complete_matrix:
+            self.init_state()
+            matrix = self.concurrency_matrix(reduced_matrix, complete_matrix)
+            return ''.join(matrix.get(node, j) for j in range(self.initial_net.number_places))
+
+        row = bytearray(self.initial_net.number_places)
+
+        ancestors = self.ancestors(node)
+        alive = self.alive_roots(ancestors, reduced_matrix)
+
+        # Dead places are independent to all others places
+        if not alive:
+            return '0' * len(row)
+        row[node] = 1
+
+        # Successors of the roots concurrent to the ones of the place
+        visited = set()
+        alive_roots = self.non_dead_roots + [self.indices[place] for i, place in enumerate(self.reduced_net.places) if reduced_matrix[i][i] == '1']
+        for root_2 in alive_roots:
+            if any(root_1 != root_2 and self.concurrent_roots(root_1, root_2, reduced_matrix) for root_1 in alive):
+                self.mark_successors(root_2, row, visited)
+
+        # Products learned by the token propagation: redundant child with the node and its previous children
+        redundant_offsets, child_offsets = self.redundant_offsets, self.child_offsets
+        for ancestor in self.live_ancestors(ancestors, alive):
+            children = self.get_children(ancestor)
+            previous = ancestor == node
+            for position, child in enumerate(children, child_offsets[ancestor]):
+                in_ancestors = child in ancestors
+                if position >= redundant_offsets[ancestor]:
+                    if previous:
+                        self.mark_successors(child, row, visited)
+                    if in_ancestors:
+                        if not self.is_additional(ancestor):
+                            row[ancestor] = 1
+                        for previous_child in children[:position - child_offsets[ancestor]]:
+                            self.mark_successors(previous_child, row, visited)
+                previous = previous or in_ancestors
+
+        return row.translate(ROW_DECODING).decode()
+
+    def concurrency_blocks(self, reduced_matrix):
+        """ Factored Change of Dimension Algorithm for Concurrency Matrix (complete reduced matrix only).
+            Return the alive roots, whose successors are the non-dead places,
+            the blocks `(nodes, nodes)` whose products of successors are concurrent places,
+            and the nodes with redundant children whose successors are concurrent to the node and its previous children.
+            (the products are the ones of `concurrency_matrix`)
         """
-        for place1, place2 in itertools.product(places1, places2):
-            place1 = self.initial_net.order[place1.id]
-            place2 = self.initial_net.order[place2.id]
-            matrix[max(place1, place2)][min(place1, place2)] = value
+        reduced_roots = [self.indices[place] for place in self.reduced_net.places]
+        alive_reduced_roots = [root for i, root in enumerate(reduced_roots) if reduced_matrix[i][i] == '1']
+
+        alive = self.non_dead_roots + alive_reduced_roots
+        blocks, prefix_products = [], []
+
+        # Products between non-dead roots, and with the alive roots of the reduced net
+        for k in range(1, len(self.non_dead_roots)):
+            blocks.append(([self.non_dead_roots[k]], self.non_dead_roots[:k]))
+        if self.non_dead_roots and alive_reduced_roots:
+            blocks.append((list(self.non_dead_roots), alive_reduced_roots))
 
-    def lazy_token_propagation(self, node, value, vector, complete_vector):
+        # Products given by the reduced matrix (lower triangle)
+        for i, line in enumerate(reduced_matrix):
+            if line[i] != '1':
+                continue
+            concurrent_roots = [reduced_roots[j] for j, concurrency in enumerate(line[:i]) if concurrency == '1' and reduced_matrix[j][j] == '1']
+            if concurrent_roots:
+                blocks.append(([reduced_roots[i]], concurrent_roots))
+
+        # Products learned by the token propagation: redundant child with the node and its previous children
+        visited, stack = set(alive), list(alive)
+        while stack:
+            node = stack.pop()
+            if self.redundant_offsets[node] < self.child_offsets[node + 1]:
+                prefix_products.append(node)
+            for child in self.get_children(node):
+                if child not in visited:
+                    visited.add(child)
+                    stack.append(child)
+
+        return alive, blocks, prefix_products
+
+    def lazy_token_propagation(self, root, value, vector, complete_vector):
         """ Lazy token propagation:
             - propagate non dead/dead places.
         """
-        # Initialization
-        successors = []
+        propagated, dead = self.propagated, self.dead
 
-        # Case: partial relation and parents already propagated
-        if not complete_vector and all(parent.propagated for parent in node.parents):
+        # Stack of the nodes to propagate with their value
+        stack = [(root, value)]
 
-            # Update `propagated` flag of the node
-            node.propagated = True
+        while stack:
+            node, value = stack.pop()
 
-            # Set the predecessors of the node
-            node.predecessors = [predecessor for parent in node.parents for predecessor in parent.predecessors]
+            # Case: partial relation
+            if not complete_vector:
+                parents = self.get_parents(node)
 
-        # Case: partial relation
-        if not complete_vector:
+                # Update `propagated` flag of the node if parents already propagated
+                if all(propagated[parent] for parent in parents):
+                    propagated[node] = True
 
-            # Update `dead` flag
-            if value == '1':
-                # If all parents are dead set the node to dead, otherwise cannot propagate a dead value anymore
-                if all(parent.dead for parent in node.parents):
-                    node.dead = True
-                else:
-                    value = '.'
-
-        # Case: the node is a place from the initial net
-        if not node.additional:
-            
-            # Set its value (if different from '.') in the dead vector (non-dead / dead)
-            if value != '.':
-                order = self.initial_net.order[node.id]
-                vector[order] = value
-
-        # Token propagation over the agglomerated nodes
-        for agglomerated in node.agglomerated:
-            agg_successors = self.lazy_token_propagation(agglomerated, value, vector, complete_vector)
-            successors += agg_successors
-            
-        # Token propagation over the redundancy nodes
-        for redundant in node.redundant:
-            red_successors = self.lazy_token_propagation(redundant, value, vector, complete_vector)
-            successors += red_successors
+                # Update `dead` flag
+                if value == '1':
+                    # If all parents are dead set the node to dead, otherwise cannot propagate a dead value anymore
+                    if all(dead[parent] for parent in parents):
+                        dead[node] = True
+                    else:
+                        value = '.'
 
-        # Return successors
-        return successors
+            # Case: the node is a place from the initial net
+            if not self.is_additional(node):
+
+                # Set its value (if different from '.') in the dead vector (non-dead / dead)
+                if value != '.':
+                    vector[node] = value
+
+            # Token propagation over the agglomerated nodes, then the redundancy nodes
+            # (pushed in reverse order to be popped in order)
+            for succ in reversed(self.get_children(node)):
+                stack.append((succ, value))
 
     def dead_places_vector(self, reduced_vector, complete_vector):
         """ Change of Dimension Algorithm for Dead Places Vector.
@@ -459,13 +916,13 @@ class TFG:
         # Case: partial relation
         if not complete_vector:
             # Propagate dead root
-            self.token_propagation(self.dead_root, '1', vector, complete_vector)
+            self.lazy_token_propagation(self.dead_root, '1', vector, complete_vector)
 
         # Propagate roots values (from the reduced net)
         for i in range(self.reduced_net.number_places):
 
             # Get corresponding root and matrix value
-            root = self.get_node(self.reduced_net.places[i])
+            root = self.indices[self.reduced_net.places[i]]
             value = reduced_vector[i]
 
             # Alive root
@@ -481,98 +938,216 @@ class TFG:
     def marking_projection(self, initial_marking):
         """ Marking projection algorithm.
         """
-        # Initialize configuration
-        configuration = {}
+        # Initialize configuration (one per call, the graph is not modified)
+        configuration = array('l', [0]) * len(self.ids)
         # Set initial marking
-        for pl in self.initial_net.places:
-            if pl in initial_marking:
-                configuration[self.get_node(pl)] = initial_marking[pl]
-            else:
-                configuration[self.get_node(pl)] = 0
+        for pl, tokens in initial_marking.items():
+            node = self.indices.get(pl)
+            if node is not None and not self.is_additional(node):
+                configuration[node] = tokens
         # Set nondead roots
         for root in self.non_dead_roots:
-            configuration[root] = int(root.id.split('#')[0])
-        # Set dead root
-        configuration[self.dead_root] = 0
+            configuration[root] = int(self.ids[root].split('#')[0])
 
         # Bottom-up propagation
-        for root in [self.get_node(place) for place in self.reduced_net.places] + [self.dead_root] + self.non_dead_roots:
-            if not self.bottom_up_token_propagation(root, configuration):
-                return None
+        if not self.bottom_up_token_propagation(configuration):
+            return None
 
         # Restrict configuration to the reduced net
-        return {place: configuration[self.get_node(place)] for place in self.reduced_net.places}
+        return {place: configuration[self.indices[place]] for place in self.reduced_net.places}
+
+    def marking_projections(self, markings):
+        """ Bulk marking projection.
+            Input: 2D array of markings (one row per marking,
+                   one column per place of the initial net, in the order of the initial net).
+            Output: 2D array of reduced markings (one column per place of the reduced net),
+                    and Boolean mask of the markings proven unreachable by the projection.
+            (vectorized over the markings if numpy is available)
+        """
+        self.bottom_up_schedule()
+
+        reduced_nodes = [self.indices[place] for place in self.reduced_net.places]
+        non_dead_values = [(root, int(self.ids[root].split('#')[0])) for root in self.non_dead_roots]
+
+        if np is None:
+            # Fallback: one bottom-up propagation per marking
+            reduced_markings, unreachable = [], []
+            for marking in markings:
+                configuration = array('l', marking) + array('l', [0]) * (len(self.ids) - len(marking))
+                for root, value in non_dead_values:
+                    configuration[root] = value
+                unreachable.append(not self.bottom_up_token_propagation(configuration))
+                reduced_markings.append([configuration[node] for node in reduced_nodes])
+            return reduced_markings, unreachable
+
+        markings = np.asarray(markings, dtype=np.int64).reshape(-1, self.initial_net.number_places)
+
+        # Configurations: one row per node, one column per marking
+        configuration = np.zeros((len(self.ids), markings.shape[0]), dtype=np.int64)
+        configuration[:self.initial_net.number_places] = markings.T
+        for root, value in non_dead_values:
+            configuration[root] = value
+
+        unreachable = np.zeros(markings.shape[0], dtype=bool)
+
+        children, child_offsets, redundant_offsets = np.array(self.children, dtype=np.int64), self.child_offsets, self.redundant_offsets
+        parents, parent_offsets = np.array(self.parents, dtype=np.int64), self.parent_offsets
+        checks, check_offsets, check_intervals = self.checks, self.check_offsets, self.check_intervals
+
+        for node in self.bottom_up_order:
+
+            # Set agglomeration configurations
+            start, end = child_offsets[node], redundant_offsets[node]
+            if start != end:
+                configuration[node] = configuration[children[start:end]].sum(axis=0)
+
+            # Check well-definedness
+            for red in checks[check_offsets[node]:check_offsets[node + 1]]:
+                tokens = configuration[parents[parent_offsets[red]:parent_offsets[red + 1]]].sum(axis=0)
+                if check_intervals[red]:
+                    unreachable |= tokens < configuration[red]
+                else:
+                    unreachable |= tokens != configuration[red]
+
+        return configuration[reduced_nodes].T, unreachable
+
+    def bottom_up_schedule(self):
+        """ Compute once the order of the bottom-up token propagation,
+            and the redundancy checks done after each node.
+            (a redundant node is checked after the last of its parents, if it is one of its redundant children)
+        """
+        if self.bottom_up_order is not None:
+            return
 
-    def bottom_up_token_propagation(self, node, configuration):
+        number_nodes = len(self.ids)
+        order = array('l', reversed(self.topological_order))
+
+        # Position of each node in the bottom-up order
+        rank = array('l', [0]) * number_nodes
+        for position, node in enumerate(order):
+            rank[node] = position
+
+        # Last propagated parent of each node
+        parents, parent_offsets = self.parents, self.parent_offsets
+        last_parents = array('l', [-1]) * number_nodes
+        for node in range(number_nodes):
+            start, end = parent_offsets[node], parent_offsets[node + 1]
+            if end - start == 1:
+                last_parents[node] = parents[start]
+            elif end - start > 1:
+                last_parents[node] = max(parents[start:end], key=rank.__getitem__)
+
+        # Redundant nodes checked after each node (grouped by node)
+        self.checks, self.check_offsets, self.check_intervals = array('l'), array('l', [0]), bytearray(number_nodes)
+        for node in range(number_nodes):
+            start = len(self.checks)
+            for red in self.get_redundant(node):
+                if last_parents[red] == node and red not in self.checks[start:]:
+                    self.checks.append(red)
+                    self.check_intervals[red] = any(self.intervals[parent] for parent in self.get_parents(red))
+            self.check_offsets.append(len(self.checks))
+
+        self.bottom_up_order = order
+
+    def bottom_up_token_propagation(self, configuration):
         """ Bottom up token propagation for marking projection.
+            (children are propagated before their parents, the graph is not modified)
         """
-        # Bottom-up token propagation
-        for succ in node.redundant + node.agglomerated:
-            if not self.bottom_up_token_propagation(succ, configuration):
-                return False
-
-        # Set agglomeration configuration
-        if node.agglomerated:
-            configuration[node] = sum([configuration[agg] for agg in node.agglomerated])
-
-        # Set propagated
-        node.propagated = True
-
-        # Check well-definedness
-        if node.redundant:
-            for red in node.redundant:
-                if all(parent.propagated for parent in red.parents):
-                    if any([parent.interval for parent in red.parents]):
-                        if sum([configuration[parent] for parent in red.parents]) < configuration[red]:
-                            return False
-                    else:
-                        if sum([configuration[parent] for parent in red.parents]) != configuration[red]:
-                            return False
+        self.bottom_up_schedule()
+
+        children, child_offsets, redundant_offsets = self.children, self.child_offsets, self.redundant_offsets
+        parents, parent_offsets = self.parents, self.parent_offsets
+        checks, check_offsets, check_intervals = self.checks, self.check_offsets, self.check_intervals
+
+        for node in self.bottom_up_order:
+
+            # Set agglomeration configuration
+            start, end = child_offsets[node], redundant_offsets[node]
+            if start != end:
+                configuration[node] = sum([configuration[agg] for agg in children[start:end]])
+
+            # Check well-definedness
+            start, end = check_offsets[node], check_offsets[node + 1]
+            if start == end:
+                continue
+
+            for red in checks[start:end]:
+                tokens = sum([configuration[parent] for parent in parents[parent_offsets[red]:parent_offsets[red + 1]]])
+                if check_intervals[red]:
+                    if tokens < configuration[red]:
+                        return False
+                else:
+                    if tokens != configuration[red]:
+                        return False
 
         return True
-        
+
 
 class Node:
     """
     Node: place or additional variable.
 
-    A node is defined by:
+    View on a node of a Token Flow Graph, defined by:
     - an identifier,
     - a Boolean indicating if the node is an additional variable (not in the initial net),
     - a list of redundant nodes,
     - a list of agglomerated nodes,
-    - a list of successors in the TFG (optional),
-    - a list of predecessors in the TFG (optional).
+    - a list of parents.
     """
 
-    def __init__(self, id, additional=False):
+    __slots__ = ('tfg', 'index')
+
+    def __init__(self, tfg, index):
         """ Initializer.
         """
-        # Id
-        self.id = id
+        # Token Flow Graph
+        self.tfg = tfg
 
-        # Flag indicating if the node is an additional variable
-        self.additional = additional
+        # Index in the Token Flow Graph
+        self.index = index
 
-        # Flag indicating if the node is an interval
-        self.interval = False
+    def __eq__(self, other):
+        """ Nodes are equal if they have the same index in the same TFG.
+        """
+        return isinstance(other, Node) and self.tfg is other.tfg and self.index == other.index
 
-        # Incoming arcs (parents)
-        self.parents = []
+    def __hash__(self):
+        """ Hash of the index.
+        """
+        return hash(self.index)
 
-        # Outgoing arcs (children)
-        self.redundant = []
-        self.agglomerated = []
+    @property
+    def id(self):
+        """ Identifier.
+        """
+        return self.tfg.ids[self.index]
 
-        # Propagation flag
-        self.propagated = False
+    @property
+    def additional(self):
+        """ Flag indicating if the node is an additional variable.
+        """
+        return self.tfg.is_additional(self.index)
 
-        # Dead flag
-        self.dead = False
+    @property
+    def interval(self):
+        """ Flag indicating if the node is an interval.
+        """
+        return bool(self.tfg.intervals[self.index])
 
-        # Succesors and predecessors in the TFG that are not additional
-        self.successors = []
-        self.predecessors = []
+    @property
+    def parents(self):
+        """ Incoming arcs (parents).
+        """
+        return [Node(self.tfg, parent) for parent in self.tfg.get_parents(self.index)]
+
+    @property
+    def redundant(self):
+        """ Outgoing redundancy arcs.
+        """
+        return [Node(self.tfg, child) for child in self.tfg.get_redundant(self.index)]
 
-        # Independent nodes set
-        self.independent = set()
+    @property
+    def agglomerated(self):
+        """ Outgoing agglomeration arcs.
+        """
+        return [Node(self.tfg, child) for child in self.tfg.get_agglomerated(self.index)]
@@ -22,8 +22,12 @@ __contact__ = "namat@laas.fr"
 __license__ = "GPLv3"
 __version__ = "2.0.0"
 
+import os
+import re
 import sys
 
+from matrix import TriangularMatrix
+
 CAESAR_BDD_MAPPER = {
     '1': '1',
     '0': '0',
@@ -35,11 +39,32 @@ CAESAR_BDD_MAPPER = {
     '[': '.',
     ']': '.'
 }
+CAESAR_BDD_TRANSLATION = str.maketrans(CAESAR_BDD_MAPPER)
+
+# Multiplier of a run in caesar.bdd output
+RLE_MULTIPLIER = re.compile(r'\((\d+)\)')
+
+# Relation between places of different components, given the diagonal values of both places
+# (translation of the diagonal values of the columns, indexed by the diagonal value of the row)
+CROSS_COMPONENTS = {
+    '1': str.maketrans('', ''),
+    '0': str.maketrans('1.', '00'),
+    '.': str.maketrans('1', '.')
+}
+
+# Runs compressed by the run-length encoding
+RLE_RUN = re.compile(r'(.)\1{3,}')
+
+# Translation of the diagonal of a concurrency matrix (marked places) to a dead places vector (dead places)
+DEAD_FROM_DIAGONAL = str.maketrans('01', '10')
+
+# Buffer size when writing a matrix to a file
+OUTPUT_BUFFER_SIZE = 1 << 20
 
 
-def show_matrix(matrix, net, no_rle=False, place_names=False):
+def show_matrix(matrix, net, no_rle=False, place_names=False, output=None):
     """ Show concurrency matrix.
-        (using run-length encoding)
+        (using run-length encoding, written to the `output` path or file object if given)
     """
     if not net.places:
         return
@@ -54,38 +79,162 @@ def show_matrix(matrix, net, no_rle=False, place_names=False):
         prefix = '# '
         output_file = sys.stderr
 
-    if len(matrix) > 0 and not isinstance(matrix[0], list):
-        matrix = (matrix,)
+    if isinstance(matrix, TriangularMatrix):
+        # Decode the packed matrix row by row
+        rows = map(matrix.row, range(len(matrix)))
+    else:
+        if len(matrix) > 0 and not isinstance(matrix[0], list):
+            matrix = (matrix,)
+        rows = map(''.join, matrix)
 
-    for pl, line in zip(net.places, matrix):
-        if place_names:
-            text = prefix + pl + ' ' * (max_len - len(pl) + 2)
-        else:
-            text = prefix
+    if not no_rle:
+        rows = map(rle_encoding, rows)
+
+    if place_names:
+        lines = (prefix + pl + ' ' * (max_len - len(pl) + 2) + row + '\n' for pl, row in zip(net.places, rows))
+    else:
+        lines = (prefix + row + '\n' for _, row in zip(net.places, rows))
+
+    if output is None:
+        output_file.writelines(lines)
+    elif hasattr(output, 'writelines'):
+        output.writelines(lines)
+    else:
+        with open(output, 'w', buffering=OUTPUT_BUFFER_SIZE) as fp:
+            fp.writelines(lines)
+
+
+def show_factored(tfg, alive, blocks, prefix_products, output=None):
+    """ Show the factored concurrency relation given by `TFG.concurrency_blocks`.
+        (written to the `output` path or file object if given, see `matrix_from_factored` for the format)
+    """
+    def single_place(nodes):
+        return len(nodes) == 1 and not (tfg.is_additional(nodes[0]) or tfg.get_children(nodes[0]))
+
+    def lines():
+        yield "N {}\n".format(tfg.initial_net.number_places)
+
+        # Token Flow Graph (nodes with children only)
+        for node in range(len(tfg.ids)):
+            children = tfg.get_children(node)
+            if children:
+                yield "G {} {}\n".format(node, ' '.join(map(str, children)))
+
+        yield "D {}\n".format(' '.join(map(str, alive)))
 
-        for i in range(len(line)):
-            elem = line[i]
-            if no_rle:
-                text += elem
+        # Products, the ones between two places as singleton cells
+        for nodes_1, nodes_2 in blocks:
+            if single_place(nodes_1) and single_place(nodes_2):
+                yield "C {} {}\n".format(nodes_1[0], nodes_2[0])
             else:
-                if i == 0:
-                    previous = elem
-                    counter = 0
-                if i == len(line) - 1:
-                    if previous != elem:
-                        text += rle_compression(previous, counter)
-                        text += elem
-                    else:
-                        text += rle_compression(previous, counter + 1)
-                else:
-                    if elem != previous:
-                        text += rle_compression(previous, counter)
-                        previous = elem
-                        counter = 1
-                    else:
-                        counter += 1
+                yield "B {} x {}\n".format(' '.join(map(str, nodes_1)), ' '.join(map(str, nodes_2)))
+
+        # Prefix products of the redundant children
+        for node in prefix_products:
+            yield "P {} {}\n".format(node, ' '.join(map(str, tfg.children[tfg.redundant_offsets[node]:tfg.child_offsets[node + 1]])))
+
+    if output is None:
+        sys.stdout.writelines(lines())
+    elif hasattr(output, 'writelines'):
+        output.writelines(lines())
+    else:
+        with open(output, 'w', buffering=OUTPUT_BUFFER_SIZE) as fp:
+            fp.writelines(lines())
+
+
+def matrix_from_factored(lines):
+    """ Return the concurrency matrix from a factored concurrency relation:
+        - `N n`: number of places of the initial net,
+        - `G node child ...`: children of a node of the Token Flow Graph (places are the nodes lower than `n`),
+        - `D node ...`: non-dead places, successors of the nodes,
+        - `B node ... x node ...`: product of the successors of the nodes,
+        - `C place place`: concurrent pair of places,
+        - `P node child ...`: product of the successors of each child (the last children of the node)
+          with the node and the successors of its previous children.
+        (the `G` lines come first, `lines` can be a stream)
+    """
+    number_places, children, matrix = 0, {}, None
+
+    def successors(nodes):
+        places, visited, stack = [], set(), list(nodes)
+        while stack:
+            node = stack.pop()
+            if node in visited:
+                continue
+            visited.add(node)
+            stack.extend(children.get(node, ()))
+            if node < number_places:
+                places.append(node)
+        return places
+
+    for line in lines:
+        tokens = line.split()
+        if not tokens or tokens[0] == '#':
+            continue
+
+        kind = tokens[0]
+        if kind == 'N':
+            number_places = int(tokens[1])
+            matrix = TriangularMatrix(number_places, '0')
+        elif kind == 'G':
+            children[int(tokens[1])] = [int(token) for token in tokens[2:]]
+        elif kind == 'D':
+            for place in successors(map(int, tokens[1:])):
+                matrix.set(place, place, '1')
+        elif kind == 'B':
+            separator = tokens.index('x')
+            matrix.set_product(successors(map(int, tokens[1:separator])), successors(map(int, tokens[separator + 1:])), '1')
+        elif kind == 'C':
+            matrix.set(int(tokens[1]), int(tokens[2]), '1')
+        elif kind == 'P':
+            node, redundant = int(tokens[1]), [int(token) for token in tokens[2:]]
+            node_children = children[node]
+
+            # Running prefix: the node and the successors of its previous children
+            prefix = [node] if node < number_places else []
+            prefix += successors(node_children[:len(node_children) - len(redundant)])
+            for child in redundant:
+                child_successors = successors([child])
+                matrix.set_product(prefix, child_successors, '1')
+                prefix += child_successors
+
+    return matrix
+
+
+def dead_places_from_matrix(matrix):
+    """ Return the dead places vector given by the diagonal of a concurrency matrix.
+    """
+    if isinstance(matrix, TriangularMatrix):
+        diagonal = matrix.diagonal()
+    else:
+        diagonal = ''.join(row[i] for i, row in enumerate(matrix))
+
+    return list(diagonal.translate(DEAD_FROM_DIAGONAL))
 
-        print(text, file=output_file)
+
+def decided_cells(previous, current):
+    """ Return the cells undecided (`.`) in a previous matrix / vector and decided in the current one.
+        (`(i, j, value)` triples for matrices, `(i, value)` pairs for vectors)
+    """
+    if isinstance(current, TriangularMatrix):
+        for i in range(len(current)):
+            previous_row, current_row = previous.row(i), current.row(i)
+            if previous_row == current_row:
+                continue
+            for j, (before, after) in enumerate(zip(previous_row, current_row)):
+                if before == '.' and after != '.':
+                    yield i, j, after
+    else:
+        for i, (before, after) in enumerate(zip(previous, current)):
+            if before == '.' and after != '.':
+                yield i, after
+
+
+def rle_encoding(row):
+    """ Run-length encoding of a row.
+        (only the runs of at least 4 values are compressed)
+    """
+    return RLE_RUN.sub(lambda run: rle_compression(run.group(1), run.end() - run.start()), row)
 
 
 def rle_compression(elem, counter):
@@ -101,46 +250,86 @@ def matrix_from_str(matrix_str):
     """ Return matrix from caesar.bdd output.
         (with run-length encoding)
     """
-    matrix_str = matrix_str.split('\n')
+    return matrix_from_lines(matrix_str.split('\n'))
 
-    if matrix_str == '':
-        return [], False 
 
+def matrix_from_lines(lines):
+    """ Return matrix from the lines of caesar.bdd output,
+        read up to the first empty line.
+        (with run-length encoding, `lines` can be a stream)
+    """
     matrix, complete_matrix = [], True
 
     # Iterate over lines
-    for line in matrix_str:
+    for line in lines:
 
-        if not len(line):
+        line = line.rstrip('\n')
+        if not line:
             break
 
-        new_line = []
-        past_value = -1
-        parse_multiplier = False
-        multiplier = ""
-
-        for value in line:           
-
-            if value == '(':
-                parse_multiplier = True
-            elif value == ')':
-                new_line.extend([past_value for _ in range(int(multiplier) - 1)])
-                parse_multiplier = False
-                multiplier = ""
-            elif parse_multiplier:
-                multiplier += value
-            else:
-                value = CAESAR_BDD_MAPPER[value]
-                if value == '.':
-                    complete_matrix = False
-                new_line.append(value)
-                past_value = value
+        # Expand the runs `value(multiplier)`, the value being the last character before the parenthesis
+        if '(' in line:
+            parts = RLE_MULTIPLIER.split(line)
+            for k in range(1, len(parts), 2):
+                parts[k] = parts[k - 1][-1] * (int(parts[k]) - 1)
+            line = ''.join(parts)
 
-        matrix.append(new_line)
+        line = line.translate(CAESAR_BDD_TRANSLATION)
+        if complete_matrix and '.' in line:
+            complete_matrix = False
+
+        matrix.append(list(line))
 
     return matrix, complete_matrix
 
 
+def stitch_matrix(places, components):
+    """ Stitch the concurrency matrices of place-disjoint components
+        into the matrix of the whole net.
+        (`components` is a list of pairs `(places, matrix)`,
+         places from different components are concurrent iff both are non-dead)
+    """
+    position = {place: index for index, place in enumerate(places)}
+
+    # Diagonal of the whole matrix
+    diagonal = ['.'] * len(places)
+    for component_places, component_matrix in components:
+        for k, place in enumerate(component_places):
+            diagonal[position[place]] = component_matrix[k][k]
+    diagonal = ''.join(diagonal)
+
+    # Relation between components
+    matrix = [list(diagonal[:i + 1].translate(CROSS_COMPONENTS[value])) for i, value in enumerate(diagonal)]
+
+    # Relation inside components
+    for component_places, component_matrix in components:
+        indices = [position[place] for place in component_places]
+        for k, line in enumerate(component_matrix):
+            i = indices[k]
+            for j, value in zip(indices, line):
+                if j <= i:
+                    matrix[i][j] = value
+                else:
+                    matrix[j][i] = value
+
+    return matrix
+
+
+def stitch_vector(places, components):
+    """ Stitch the dead places vectors of place-disjoint components
+        into the vector of the whole net.
+        (`components` is a list of pairs `(places, vector)`)
+    """
+    position = {place: index for index, place in enumerate(places)}
+
+    vector = ['.'] * len(places)
+    for component_places, component_vector in components:
+        for place, value in zip(component_places, component_vector):
+            vector[position[place]] = value
+
+    return vector
+
+
 def marking_parser(marking_str):
     """ Parse marking.
     """
@@ -157,3 +346,25 @@ def marking_parser(marking_str):
         marking[place_marking[0]] = tokens
 
     return marking
+
+
+def markings_parser(path):
+    """ Parse a set of markings:
+        a directory of marking files, or a file with one marking per line.
+        (return a list of pairs `(name, marking)`, named by file name or line number)
+    """
+    markings = []
+
+    if os.path.isdir(path):
+        for filename in sorted(os.listdir(path)):
+            marking_path = os.path.join(path, filename)
+            if os.path.isfile(marking_path):
+                with open(marking_path) as fp:
+                    markings.append((filename, marking_parser(fp.read())))
+    else:
+        with open(path) as fp:
+            for number, line in enumerate(fp, 1):
+                if line.strip():
+                    markings.append((str(number), marking_parser(line)))
+
+    return markings